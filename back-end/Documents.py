@@ -1,9 +1,18 @@
 import cohere
 import hnswlib
-import json
+import numpy as np
 from typing import List, Dict
-from io import StringIO
-import requests
+from firebase_operations import read_artifact
+from structure_format import read_structure
+from embedding_providers import get_embedding_provider
+from embedding_cache import EmbeddingCache, embedding_key, corpus_key
+from lexical_index import (
+    BM25Index,
+    reciprocal_rank_fusion,
+    HYBRID_DENSE_WEIGHT,
+    HYBRID_LEXICAL_WEIGHT,
+)
+from query_cache import normalize_query, query_embeddings, retrieval_results
 
 from dotenv import load_dotenv
 import os
@@ -12,6 +21,12 @@ load_dotenv()
 
 co = cohere.Client(os.getenv("COHERE_API_KEY"))
 
+# Embeddings of the documents and queries (Cohere or a local model)
+embedding_provider = get_embedding_provider(co)
+
+# Embeddings and indexes of the documents already seen
+embedding_cache = EmbeddingCache()
+
 
 class Documents:
     """
@@ -24,15 +39,20 @@ class Documents:
     sources (list): A list of dictionaries representing the sources of the documents.
     docs (list): A list of dictionaries representing the documents, with 'title', 'content', and 'url' keys.
     docs_embs (list): A list of the associated embeddings for the documents.
+    embedding_keys (list): The keys of the embeddings in the local cache.
     retrieve_top_k (int): The number of documents to retrieve during search.
     rerank_top_k (int): The number of documents to rerank after retrieval.
     docs_len (int): The number of documents in the collection.
     index (hnswlib.Index): The index used for document retrieval.
+    lexical_index (BM25Index): The BM25 index of the titles and texts of the documents.
+    corpus_version (str): The hash of the embedding keys; the cached results are keyed by it.
 
     Methods:
     load(): Loads the data from the sources and partitions the HTML content into chunks.
-    embed(): Embeds the documents using the Cohere API.
+    embed(): Embeds the documents with the embedding provider.
     index(): Indexes the documents for efficient retrieval.
+    search(query): Ranks the documents for the query, fusing the dense and lexical rankings.
+    rank(query): Reranks the best documents of search(query).
     retrieve(query): Retrieves documents based on the given query.
     """
 
@@ -55,9 +75,9 @@ class Documents:
         """
         print("Loading documents from JSON URL...")
 
-        response = requests.get(json_url)
-        if response.status_code == 200:
-            data = json.load(StringIO(response.text))
+        # Read from the local copy when the storage backend has one
+        with read_artifact(json_url) as artifact:
+            data = read_structure(artifact)
 
         for chapter_key, chapters in data.items():
             for chapter, blocks in chapters.items():
@@ -83,49 +103,129 @@ class Documents:
 
     def embed(self) -> None:
         """
-        Embeds the documents using the Cohere API.
+        Embeds the documents with the embedding provider. The embeddings already in
+        the local cache (same text and model) are reused, only the others are computed.
         """
         print("Embedding documents...")
 
-        batch_size = 90
         self.docs_len = len(self.docs)
+        self.embedding_keys = [
+            embedding_key(embedding_provider.name, "search_document", doc["text"])
+            for doc in self.docs
+        ]
+
+        embeddings = embedding_cache.get_many(self.embedding_keys)
+        texts_to_embed = {
+            key: doc["text"]
+            for key, doc in zip(self.embedding_keys, self.docs)
+            if key not in embeddings
+        }
+        keys = list(texts_to_embed)
+
+        def store_batch(start, batch_embeddings):
+            new_embeddings = {
+                key: np.asarray(embedding, dtype=np.float32)
+                for key, embedding in zip(keys[start:], batch_embeddings)
+            }
+            embedding_cache.put_many(new_embeddings)
+            embeddings.update(new_embeddings)
+
+        _, self.embedding_stats = embedding_provider.embed_documents(
+            [texts_to_embed[key] for key in keys], on_batch=store_batch
+        )
 
-        for i in range(0, self.docs_len, batch_size):
-            batch = self.docs[i : min(i + batch_size, self.docs_len)]
-            texts = [item["text"] for item in batch]
-            docs_embs_batch = co.embed(
-                texts=texts, model="embed-english-v3.0", input_type="search_document"
-            ).embeddings
-            self.docs_embs.extend(docs_embs_batch)
+        self.docs_embs = [embeddings[key] for key in self.embedding_keys]
+        print(
+            f"{self.docs_len - len(keys)} embeddings from the cache, {len(keys)} computed."
+        )
 
     def index(self) -> None:
         """
-        Indexes the documents for efficient retrieval.
+        Indexes the documents for efficient retrieval. The index of an unchanged
+        corpus is loaded from disk instead of being rebuilt. The BM25 index, fast
+        to build, is always built in memory.
         """
         print("Indexing documents...")
 
-        self.idx = hnswlib.Index(space="ip", dim=1024)
+        self.lexical_index = BM25Index(
+            [f"{doc['title']}\n{doc['text']}" for doc in self.docs]
+        )
+
+        manifest = {
+            "model": embedding_provider.name,
+            "space": "ip",
+            "dim": embedding_provider.dim,
+            "count": self.docs_len,
+            "ef_construction": 512,
+            "M": 64,
+        }
+        key = corpus_key(self.embedding_keys)
+        self.corpus_version = key
+
+        self.idx = embedding_cache.load_index(key, manifest)
+        if self.idx is not None:
+            print(f"Index loaded with {self.idx.get_current_count()} documents.")
+            return
+
+        self.idx = hnswlib.Index(space="ip", dim=embedding_provider.dim)
         self.idx.init_index(max_elements=self.docs_len, ef_construction=512, M=64)
-        self.idx.add_items(self.docs_embs, list(range(len(self.docs_embs))))
+        self.idx.add_items(np.vstack(self.docs_embs), list(range(len(self.docs_embs))))
+        embedding_cache.save_index(key, self.idx, manifest)
 
         print(f"Indexing complete with {self.idx.get_current_count()} documents.")
 
-    def retrieve(self, query: str) -> List[Dict[str, str]]:
+    def search(
+        self,
+        query: str,
+        k: int,
+        dense_weight: float = HYBRID_DENSE_WEIGHT,
+        lexical_weight: float = HYBRID_LEXICAL_WEIGHT,
+    ) -> List[int]:
         """
-        Retrieves documents based on the given query.
+        Ranks the documents for a query: the nearest neighbours of its embedding and
+        the best BM25 matches (exact identifiers, section numbers, acronyms) are
+        fused with reciprocal rank fusion.
 
         Parameters:
-        query (str): The query to retrieve documents for.
+        query (str): The query.
+        k (int): The number of documents to return.
+        dense_weight (float): The weight of the embedding ranking (0 disables it).
+        lexical_weight (float): The weight of the BM25 ranking (0 disables it).
 
         Returns:
-        List[Dict[str, str]]: A list of dictionaries representing the retrieved documents, with 'title', 'text', and 'url' keys.
+        List[int]: The ids of the documents, best first.
         """
-        docs_retrieved = []
-        query_emb = co.embed(
-            texts=[query], model="embed-english-v3.0", input_type="search_query"
-        ).embeddings
+        k = min(k, self.docs_len)
+        rankings, weights = [], []
+        if dense_weight > 0 or lexical_weight <= 0:
+            query_emb = query_embeddings.get(
+                (embedding_provider.name, normalize_query(query)),
+                lambda: embedding_provider.embed_query(query),
+            )
+            labels = self.idx.knn_query(query_emb, k=k)[0][0]
+            rankings.append([int(doc_id) for doc_id in labels])
+            weights.append(dense_weight)
+        if lexical_weight > 0:
+            rankings.append(
+                [doc_id for doc_id, _ in self.lexical_index.search(query, k)]
+            )
+            weights.append(lexical_weight)
+
+        if len(rankings) == 1:
+            return rankings[0]
+        return reciprocal_rank_fusion(rankings, weights)[:k]
+
+    def rank(self, query: str) -> List[int]:
+        """
+        Reranks the best documents found by search for the given query.
+
+        Parameters:
+        query (str): The query to rank the documents for.
 
-        doc_ids = self.idx.knn_query(query_emb, k=self.retrieve_top_k)[0][0]
+        Returns:
+        List[int]: The ids of the rerank_top_k best documents, best first.
+        """
+        doc_ids = self.search(query, self.retrieve_top_k)
 
         docs_to_rerank = []
         for doc_id in doc_ids:
@@ -142,6 +242,32 @@ class Documents:
         for result in rerank_results:
             doc_ids_reranked.append(doc_ids[result.index])
 
+        return doc_ids_reranked
+
+    def retrieve(self, query: str) -> List[Dict[str, str]]:
+        """
+        Retrieves documents based on the given query. The ranking of a query
+        already asked on the same corpus (and settings) is reused.
+
+        Parameters:
+        query (str): The query to retrieve documents for.
+
+        Returns:
+        List[Dict[str, str]]: A list of dictionaries representing the retrieved documents, with 'title', 'text', and 'url' keys.
+        """
+        docs_retrieved = []
+        key = (
+            self.corpus_version,
+            normalize_query(query),
+            self.retrieve_top_k,
+            self.rerank_top_k,
+            HYBRID_DENSE_WEIGHT,
+            HYBRID_LEXICAL_WEIGHT,
+        )
+        doc_ids_reranked = list(
+            retrieval_results.get(key, lambda: tuple(self.rank(query)))
+        )
+
         for doc_id in doc_ids_reranked:
             docs_retrieved.append(
                 {
@@ -1,19 +1,24 @@
 import fitz
 import os
 import shutil
-import base64
 from utils import (
     download_pdf_from_url,
+    new_image_registry,
     process_page,
     process_image,
     get_title,
     change_structure,
+    index_from_outline,
 )
 from firebase_operations import upload_images_to_firebase
+from image_operations import prepare_vision_image, create_image_variants
 from mongo_db_operations import load_url, mongo_load_data
 from openai_operations import nodes_and_edges, generate_index
 from index_search import find_top_similarities
+from graph_snapshots import refresh_pdf_graph_snapshot
 from logger import logger
+from structure_format import structure_file_name
+from tracing import span, traced, set_span_attributes
 
 # Constants
 TARGET_KEYWORDS = [
@@ -27,56 +32,38 @@ TARGET_KEYWORDS = [
 ]
 
 
-def elabora_dati(file_name: str, download_url: str):
+def index_from_vision(file_name: str, pdf_folder: str):
     """
-    Process data from a PDF file, including downloading, extracting images, identifying the index pages,
-    and generating a structured JSON representation.
+    Build the index of a PDF by detecting its index pages and reading them with GPT4-Vision.
 
     Parameters:
     - file_name (str): The name of the PDF file.
-    - download_url (str): The URL from which to download the PDF.
+    - pdf_folder (str): The folder containing the page images.
 
     Returns:
-    - None
+    - dict: The index in the format {"index": {"chapter N": {"title": ..., "page": ...}}}.
     """
-    # Log the start of data processing
-    logger.info(f"Processing data: {file_name, download_url}")
-
-    # Download the PDF file
-    download_pdf_from_url(download_url, file_name)
-    logger.info("File downloaded!")
-
-    # Open the PDF document
-    pdf_document = fitz.open(file_name)
-    pdf_whitout_extension = os.path.splitext(file_name)[0]
-    pdf_folder = os.path.join(os.getcwd(), pdf_whitout_extension)
-    os.makedirs(pdf_folder, exist_ok=True)
-    logger.info("Folder created successfully!")
-
-    # Process each page of the PDF, saving it as an image
-    for page_num in range(len(pdf_document)):
-        process_page(pdf_document, page_num, pdf_folder)
-    logger.info("Pages transformed into images")
-
     # Identify index pages using predefined keywords
-    similarities = find_top_similarities(file_name, TARGET_KEYWORDS)
-    index_pages = [tupla[0] for tupla in similarities]
-    index_pages.sort()
+    with span("index_detection") as index_span:
+        similarities = find_top_similarities(file_name, TARGET_KEYWORDS)
+        index_pages = [tupla[0] for tupla in similarities]
+        index_pages.sort()
+        index_span.set_attribute("index_pages", index_pages)
     logger.info(f"Identified index pages: {index_pages}")
 
     # Extract images for GPT4-Vision processing
     logger.info("Extracting images for GPT4-Vision")
     image_blocks = []
-    for page_num in index_pages:
-        image_folder = f"{pdf_folder}/page_{page_num}.png"
-        with open(image_folder, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-            image_blocks.append(
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
-                }
-            )
+    payload_stats = {}
+    with span("vision_payload") as payload_span:
+        for page_num in index_pages:
+            image_folder = f"{pdf_folder}/page_{page_num}.png"
+            image_block, stats = prepare_vision_image(image_folder)
+            image_blocks.append(image_block)
+            for key, value in stats.items():
+                payload_stats[key] = payload_stats.get(key, 0) + value
+        payload_span.attributes.update(payload_stats)
+    logger.info(f"GPT4-Vision payload: {payload_stats}")
 
     # Call GPT4-Vision to process images
     logger.info("Calling GPT4-Vision")
@@ -117,14 +104,84 @@ def elabora_dati(file_name: str, download_url: str):
     messages[0]["content"].extend(image_blocks)
 
     # Generate index using GPT4-Vision
-    result_json = generate_index(messages)
+    with span("gpt4v_index", images=len(image_blocks)):
+        result_json = generate_index(messages)
+
+    return result_json
+
+
+@traced("ingestion", export=True)
+def elabora_dati(file_name: str, download_url: str):
+    """
+    Process data from a PDF file, including downloading, extracting images, identifying the index pages,
+    and generating a structured JSON representation.
+
+    Parameters:
+    - file_name (str): The name of the PDF file.
+    - download_url (str): The URL from which to download the PDF.
+
+    Returns:
+    - dict: The title of the PDF, the URL of its structure and its graph
+      (structure, members, levels, concepts and version), to update the running server.
+    """
+    # Log the start of data processing
+    logger.info(f"Processing data: {file_name, download_url}")
+    set_span_attributes(document=file_name)
+
+    # Download the PDF file
+    with span("download", url=download_url) as download_span:
+        download_pdf_from_url(download_url, file_name)
+        download_span.set_attribute("bytes", os.path.getsize(file_name))
+    logger.info("File downloaded!")
+
+    # Open the PDF document
+    pdf_document = fitz.open(file_name)
+    pdf_whitout_extension = os.path.splitext(file_name)[0]
+    pdf_folder = os.path.join(os.getcwd(), pdf_whitout_extension)
+    os.makedirs(pdf_folder, exist_ok=True)
+    logger.info("Folder created successfully!")
+
+    set_span_attributes(page_count=len(pdf_document))
+
+    # Process each page of the PDF, saving it as an image
+    image_registry = new_image_registry()
+    with span("rasterize", page_count=len(pdf_document)) as rasterize_span:
+        for page_num in range(len(pdf_document)):
+            with span("rasterize.page", page=page_num + 1) as page_span:
+                image_list = process_page(
+                    pdf_document, page_num, pdf_folder, image_registry
+                )
+                page_span.set_attribute("embedded_images", len(image_list))
+        rasterize_span.set_attribute("distinct_images", len(image_registry["hashes"]))
+    logger.info("Pages transformed into images")
+
+    # Build the index from the outline embedded in the PDF when available,
+    # otherwise detect the index pages and read them with GPT4-Vision
+    result_json = index_from_outline(pdf_document)
+    if result_json is not None:
+        toc_source = "outline"
+    else:
+        toc_source = "vision"
+        result_json = index_from_vision(file_name, pdf_folder)
+    set_span_attributes(toc_source=toc_source)
+    logger.info(f"Index built from the {toc_source} path")
 
     # Generate JSON structure
     json_structure = {pdf_whitout_extension: result_json}
     logger.info("Indice creato con successo")
 
+    # Create thumbnails and compressed display variants of the images
+    with span("image_variants"):
+        image_variants = create_image_variants(f"{pdf_whitout_extension}_images")
+
     # Upload images to Firebase
-    image_urls_dict = upload_images_to_firebase(pdf_whitout_extension)
+    with span("firebase_upload") as upload_span:
+        image_urls_dict = upload_images_to_firebase(
+            pdf_whitout_extension, image_registry["pages"], image_variants
+        )
+        upload_span.set_attribute(
+            "images", sum(len(urls) for urls in image_urls_dict.values())
+        )
     logger.info("Immagini caricate su Firebase")
 
     # Process images using OCR (Optical Character Recognition)
@@ -134,12 +191,15 @@ def elabora_dati(file_name: str, download_url: str):
     image_files.sort(key=lambda x: int(x.split("_")[1].split(".")[0]))
 
     all_blueprints = {}
-    for image_file in image_files:
-        page, _ = os.path.splitext(image_file)
-        image_path = os.path.join(pdf_whitout_extension, image_file)
-        logger.info(f"OCR su {image_path}")
-        blueprint = process_image(image_path, r"-l eng")
-        all_blueprints[page] = blueprint
+    with span("ocr", page_count=len(image_files)):
+        for image_file in image_files:
+            page, _ = os.path.splitext(image_file)
+            image_path = os.path.join(pdf_whitout_extension, image_file)
+            logger.info(f"OCR su {image_path}")
+            with span("ocr.page", page=page) as page_span:
+                blueprint = process_image(image_path, r"-l eng")
+                page_span.set_attribute("blocks", len(blueprint))
+            all_blueprints[page] = blueprint
     logger.info("Images extracted from the PDF")
 
     # Create introduction pages
@@ -203,7 +263,8 @@ def elabora_dati(file_name: str, download_url: str):
     logger.info("JSON structure created!")
 
     # Generate block titles and save the JSON to file and Firebase
-    structure, url = get_title(json_structure)
+    with span("titling"):
+        structure, url = get_title(json_structure)
 
     # Load URLs to MongoDB
     load_url(pdf_whitout_extension, url)
@@ -212,10 +273,21 @@ def elabora_dati(file_name: str, download_url: str):
     new_structure = change_structure(structure)
 
     # Generate nodes and edges using ChatGPT
-    mongo_data = nodes_and_edges(new_structure)
+    with span("graph_generation"):
+        mongo_data = nodes_and_edges(new_structure)
 
     # Load everything into MongoDB
-    mongo_load_data(mongo_data)
+    with span("mongo_load") as mongo_span:
+        mongo_span.set_attribute(
+            "documents", sum(len(documents) for documents in mongo_data.values())
+        )
+        mongo_load_data(mongo_data)
+
+    # Save the graph of the PDF as a snapshot for the servers
+    with span("graph_snapshot"):
+        pdf_structure, pdf_members, levels, concepts, version = (
+            refresh_pdf_graph_snapshot(pdf_whitout_extension)
+        )
 
     # Close the PDF document
     pdf_document.close()
@@ -223,7 +295,7 @@ def elabora_dati(file_name: str, download_url: str):
     # Delete PDF files, folders, and their contents
     try:
         os.remove(file_name)
-        os.remove(pdf_whitout_extension + ".json")
+        os.remove(structure_file_name(pdf_whitout_extension))
         logger.info(f"Files {pdf_whitout_extension} successfully deleted.")
         shutil.rmtree(pdf_whitout_extension)
         shutil.rmtree(pdf_whitout_extension + "_images")
@@ -232,3 +304,13 @@ def elabora_dati(file_name: str, download_url: str):
         logger.error(f"File not found: {e}")
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
+
+    return {
+        "title": pdf_whitout_extension,
+        "url": url,
+        "structure": pdf_structure,
+        "members": pdf_members,
+        "levels": levels,
+        "concepts": concepts,
+        "version": version,
+    }
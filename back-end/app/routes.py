@@ -1,15 +1,24 @@
 from app import app
-from flask import request, jsonify
+from flask import request, jsonify, send_from_directory, abort
 from PDFResearch import elabora_dati
-from Documents import Documents
-from Chatbot import Chatbot
-from mongo_db_operations import collection_pdf, collection_url
-from graph import process_document, sort_and_merge_nodes_and_edges
-from umap_visualization import (
-    create_umap_visualization,
-    create_initial_umap_visualization,
-)
+from corpus_registry import CorpusRegistry
+from query_cache import query_cache_stats
+from mongo_db_operations import ensure_indexes, find_pdf_titles, find_urls
+from firebase_operations import STORAGE_BACKEND, storage_backend
+from graph_snapshots import load_pdf_graph
+from graph_levels import LEVELS
+from graph_queries import chapter_subgraph, paginate, InvalidCursor
+from graph_index import GraphIndex, DIRECTIONS, DEFAULT_MAX_NODES
+from concept_merging import merge_concepts
+from graph_store import GRAPH_STORE, compact_pdf_graph, deep_sizeof
+from response_cache import ResponseCache
+from logger import logger
+from umap_visualization import create_umap_visualization
+import hashlib
+import json
+import os
 import re
+import threading
 
 # Document structure
 structure = {}
@@ -20,52 +29,327 @@ members = {}
 # URLs
 urls = {}
 
-# PDF title
+# Title of the current PDF of the chat
 title_of_pdf = ""
 
 # Links
 links = {}
 
-# Embeddings
-embedding = []
+# Graph versions
+versions = {}
+
+# Indexes of the collections, before the first query
+ensure_indexes()
+
+# Titles of the PDFs, read once and refreshed when a PDF is ingested
+pdf_titles = set(find_pdf_titles())
+
+# Guards the graph state (structure, members, levels, versions) as a whole
+graph_lock = threading.Lock()
+
+# One lock per PDF, so that a graph is never loaded twice at the same time
+graph_load_locks = {}
+
+# Reduced levels of detail of the structure of each PDF
+levels = {}
+
+# Concept graph of each PDF, merged when its snapshot was built
+concepts = {}
+
+# Concept graph of every PDF, merged when the graphs are loaded or a PDF is
+# ingested: (graphs version, graph)
+global_concepts = (None, None)
+global_concepts_lock = threading.Lock()
+
+# Corpus (documents, index, chatbot, UMAP projection) of each PDF
+corpus_registry = CorpusRegistry()
+
+# Serialized, pre-compressed graph responses
+response_cache = ResponseCache()
+
+# Adjacency indexes of the knowledge graphs, by PDF: (version, GraphIndex)
+graph_indexes = {}
+
+# Load every graph at startup, or each one on its first request
+GRAPH_PRELOAD = os.getenv("GRAPH_PRELOAD", "true").lower() == "true"
 
 
 # Chatbot
-def run_chatbot(url):
+def select_corpus(pdf_title: str):
     """
-    Create an instance of the Documents class with the provided JSON file
-    and an instance of the Chatbot class with the Documents instance.
+    Return the corpus of a PDF from the registry (building it if needed) and
+    make it the current PDF of the chat, with its UMAP plot.
     """
-    documents = Documents(url)
-    pdf_chatbot = Chatbot(documents)
-    link, embedding_fit = create_initial_umap_visualization(url, title_of_pdf)
-    embedding.clear()
-    embedding.append(embedding_fit)
+    global title_of_pdf
+    url = urls.get(pdf_title)
+    if url is None:
+        abort(404, description=f"PDF not found: {pdf_title}")
+
+    corpus = corpus_registry.get(pdf_title, url)
+    link, _ = corpus.ensure_projection()
+    corpus_registry.update_size(pdf_title)
+
+    title_of_pdf = pdf_title
     links["PDF"] = link
-    return pdf_chatbot
+    return corpus
+
+
+def load_graph(pdf_title: str):
+    """
+    Load the graph of a PDF from its snapshot (rebuilt if missing or stale)
+    into the structure and members served by the routes, unless a concurrent
+    request loaded it meanwhile.
+    """
+    with graph_lock:
+        load_lock = graph_load_locks.setdefault(pdf_title, threading.Lock())
+
+    with load_lock:
+        if pdf_title in structure:
+            return
+        pdf_structure, pdf_members, pdf_levels, pdf_concepts, version = load_pdf_graph(
+            pdf_title
+        )
+        if pdf_structure is not None:
+            serve_graph(
+                pdf_title,
+                pdf_structure,
+                pdf_members,
+                pdf_levels,
+                pdf_concepts,
+                version,
+            )
+        else:
+            # Without documents there is nothing to load until it is ingested
+            with graph_lock:
+                pdf_titles.discard(pdf_title)
+
+
+def serve_graph(
+    pdf_title: str,
+    pdf_structure: dict,
+    pdf_members: dict,
+    pdf_levels: dict,
+    pdf_concepts: dict,
+    version: str,
+):
+    """
+    Put the graph of a PDF in the live state, in the representation set by
+    GRAPH_STORE (compact by default).
+    """
+    if GRAPH_STORE == "compact":
+        dict_size = deep_sizeof(pdf_structure) + deep_sizeof(pdf_members)
+        pdf_structure, pdf_members, store = compact_pdf_graph(
+            pdf_structure, pdf_members
+        )
+        logger.info(
+            f"Graph of '{pdf_title}' stored compactly: "
+            f"{dict_size} -> {store.memory_usage()} bytes"
+        )
+    with graph_lock:
+        structure[pdf_title] = pdf_structure
+        members[pdf_title] = pdf_members
+        levels[pdf_title] = pdf_levels
+        concepts[pdf_title] = pdf_concepts
+        versions[pdf_title] = version
+        pdf_titles.add(pdf_title)
+
+
+def merge_ingested_pdf(result: dict):
+    """
+    Merge a newly ingested PDF into the live state: its graph, its URL and a
+    warmed corpus, without touching the other PDFs.
+    """
+    pdf_title = result["title"]
+    if result["structure"] is not None:
+        serve_graph(
+            pdf_title,
+            result["structure"],
+            result["members"],
+            result["levels"],
+            result["concepts"],
+            result["version"],
+        )
+        response_cache.invalidate(pdf_title)
+        refresh_global_concepts()
+    urls[pdf_title] = result["url"]
+    logger.info(f"Graph of '{pdf_title}' merged into the live state.")
+
+    # The URL of a re-ingested PDF does not change: drop the former corpus
+    corpus_registry.evict(pdf_title)
+
+    # Embed and index the new corpus in the background
+    def warm_corpus(url: str):
+        try:
+            corpus_registry.get(pdf_title, url)
+            logger.info(f"Corpus of '{pdf_title}' warmed.")
+        except Exception as e:
+            logger.error(f"Unable to warm the corpus of '{pdf_title}': {e}")
+
+    threading.Thread(target=warm_corpus, args=(result["url"],), daemon=True).start()
+
+
+def ensure_graphs_loaded():
+    """
+    Load the graphs of the PDFs that are not loaded yet (on demand loading).
+    """
+    with graph_lock:
+        missing = [title for title in pdf_titles if title not in structure]
+    for pdf_title in missing:
+        load_graph(pdf_title)
+
+
+def get_pdf_graph(pdf_title: str):
+    """
+    Return the structure and the members of a single PDF, loading its graph if
+    needed. Aborts with 404 if the PDF does not exist.
+    """
+    if pdf_title not in structure:
+        load_graph(pdf_title)
+    if pdf_title not in structure:
+        abort(404, description=f"PDF not found: {pdf_title}")
+    return structure[pdf_title], members[pdf_title]
+
+
+def get_graph_index(pdf_title: str):
+    """
+    Return the adjacency index of the knowledge graph of a PDF, built on the
+    first request and rebuilt when the graph version changes.
+    """
+    pdf_members = get_pdf_graph(pdf_title)[1]
+    version = versions.get(pdf_title)
+    cached = graph_indexes.get(pdf_title)
+    if cached is None or cached[0] != version:
+        cached = graph_indexes[pdf_title] = (
+            version,
+            GraphIndex.from_members(pdf_members),
+        )
+    return cached[1]
+
+
+def graph_node_arg(index: GraphIndex, name: str):
+    """
+    Return a node id from the query parameters, aborting if it is missing or unknown.
+    """
+    node_id = request.args.get(name)
+    if node_id is None:
+        abort(400, description=f"Missing parameter: {name}")
+    if node_id not in index:
+        abort(404, description=f"Node not found: {node_id}")
+    return node_id
+
+
+def direction_arg():
+    """
+    Return the direction of a traversal from the query parameters.
+    """
+    direction = request.args.get("direction", "both")
+    if direction not in DIRECTIONS:
+        abort(400, description=f"direction must be one of {', '.join(DIRECTIONS)}")
+    return direction
+
+
+def structure_at_level(pdf_title: str, level: str):
+    """
+    Return the structure of a loaded PDF at a level of detail.
+    """
+    if level == "full":
+        return structure[pdf_title]
+    return levels[pdf_title][level]
+
+
+def graphs_version():
+    """
+    Return a version covering the graphs of every loaded PDF.
+    """
+    with graph_lock:
+        items = sorted(versions.items())
+    return hashlib.sha1(json.dumps(items).encode("utf-8")).hexdigest()
+
+
+def refresh_global_concepts():
+    """
+    Merge the concept graphs of every loaded PDF, unless they are already
+    merged for the current version of the graphs.
+
+    Returns:
+        tuple: The version of the graphs and the merged concept graph.
+    """
+    global global_concepts
+    with global_concepts_lock:
+        # Read before the members, so that a graph served meanwhile is merged again
+        version = graphs_version()
+        if global_concepts[0] != version:
+            with graph_lock:
+                pdf_members = dict(members)
+            global_concepts = (version, merge_concepts(pdf_members))
+        return global_concepts
+
+
+def cached_json(key: tuple, version: str, build):
+    """
+    Return a JSON response serialized once per graph version and stored
+    pre-compressed, answering 304 when the client already has it (If-None-Match).
+
+    Args:
+        key (tuple): The key of the response, starting with the PDF title
+                     (None for the responses covering every PDF).
+        version (str): The version of the graph.
+        build (callable): Returns the data of the response.
+    """
+    entry = response_cache.get(key, version, build)
+    encoding, body, etag = entry.select(request.accept_encodings)
+
+    if any(request.if_none_match.contains(tag) for tag in entry.etags()):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype="application/json")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    # Always revalidate: the graph changes when a PDF is ingested
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def paginated_response(pdf_title: str, field: str):
+    """
+    Return a page of the nodes or edges of a PDF, selected by the "cursor" and
+    "limit" query parameters.
+    """
+    pdf_structure = get_pdf_graph(pdf_title)[0]
+    version = versions.get(pdf_title, "")
+    cursor = request.args.get("cursor")
+    limit = request.args.get("limit", type=int)
+
+    def build():
+        try:
+            return paginate(pdf_structure[field], version, cursor, limit)
+        except InvalidCursor as e:
+            abort(400, description=str(e))
+
+    return cached_json((pdf_title, field, cursor, limit), version, build)
 
 
 # Iterate over PDFs
-for doc in collection_pdf.find():
-    process_document(doc, structure, members)
+if GRAPH_PRELOAD:
+    for pdf_title in sorted(pdf_titles):
+        load_graph(pdf_title)
+    refresh_global_concepts()
 
 # Iterate over URLs
-for doc in collection_url.find():
+for doc in find_urls():
     title = doc["title"]
     url = doc["url"]
     urls[title] = url
     title_of_pdf = title
 
 # Iterate over PDF titles
-for pdf_title, pdf_data in structure.items():
-    sort_and_merge_nodes_and_edges(pdf_data)
-
-    # Get the URL of the PDF
-    pdf = urls.get(pdf_title, None)
-
-    # Chatbot
-    if pdf is not None:
-        pdf_chatbot = run_chatbot(pdf)
+for pdf_title in find_pdf_titles():
+    # Chatbot (the registry keeps the corpora within its memory budget)
+    if pdf_title in urls:
+        select_corpus(pdf_title)
     else:
         # Handle the case where the PDF URL is not found
         print(f"PDF URL not found for title: {pdf_title}")
@@ -74,12 +358,129 @@ for pdf_title, pdf_data in structure.items():
 # Routes
 @app.route("/hierarchy")
 def get_structure():
-    return structure
+    # Level of detail: "chapters", "top" (best blocks of each chapter) or "full"
+    level = request.args.get("level", "full")
+    if level not in LEVELS:
+        abort(400, description=f"level must be one of {', '.join(LEVELS)}")
+
+    # A single PDF with ?pdf=<title>, every PDF otherwise
+    pdf_title = request.args.get("pdf")
+    if pdf_title is not None:
+        get_pdf_graph(pdf_title)
+        return cached_json(
+            (pdf_title, "hierarchy", level),
+            versions[pdf_title],
+            lambda: {pdf_title: structure_at_level(pdf_title, level)},
+        )
+    ensure_graphs_loaded()
+    return cached_json(
+        (None, "hierarchy", level),
+        graphs_version(),
+        lambda: {title: structure_at_level(title, level) for title in list(structure)},
+    )
+
+
+@app.route("/hierarchy/<pdf_title>/chapters/<path:chapter>")
+def get_chapter(pdf_title, chapter):
+    pdf_structure = get_pdf_graph(pdf_title)[0]
+
+    def build():
+        subgraph = chapter_subgraph(pdf_structure, chapter)
+        if subgraph is None:
+            abort(404, description=f"Chapter not found: {chapter}")
+        return subgraph
+
+    return cached_json((pdf_title, "chapter", chapter), versions[pdf_title], build)
+
+
+@app.route("/hierarchy/<pdf_title>/nodes")
+def get_structure_nodes(pdf_title):
+    return paginated_response(pdf_title, "initialNodes")
+
+
+@app.route("/hierarchy/<pdf_title>/edges")
+def get_structure_edges(pdf_title):
+    return paginated_response(pdf_title, "initialEdges")
 
 
 @app.route("/members")
 def get_data():
-    return members
+    # A single PDF with ?pdf=<title>, every PDF otherwise
+    pdf_title = request.args.get("pdf")
+    if pdf_title is not None:
+        pdf_members = get_pdf_graph(pdf_title)[1]
+        return cached_json(
+            (pdf_title, "members"),
+            versions[pdf_title],
+            lambda: {pdf_title: pdf_members},
+        )
+    ensure_graphs_loaded()
+    return cached_json((None, "members"), graphs_version(), lambda: dict(members))
+
+
+@app.route("/members/<pdf_title>/<path:page_block>")
+def get_block_graph(pdf_title, page_block):
+    pdf_members = get_pdf_graph(pdf_title)[1]
+    if page_block not in pdf_members:
+        abort(404, description=f"Block not found: {page_block}")
+    return cached_json(
+        (pdf_title, "block", page_block),
+        versions[pdf_title],
+        lambda: pdf_members[page_block],
+    )
+
+
+@app.route("/graph/<pdf_title>/neighbors")
+def get_neighbors(pdf_title):
+    index = get_graph_index(pdf_title)
+    node_id = graph_node_arg(index, "node")
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 0:
+        abort(400, description="limit must not be negative")
+    edges = index.neighbors(node_id, direction_arg(), limit)
+    return jsonify({"node": node_id, "edges": edges})
+
+
+@app.route("/graph/<pdf_title>/khop")
+def get_k_hop(pdf_title):
+    index = get_graph_index(pdf_title)
+    node_id = graph_node_arg(index, "node")
+    return jsonify(
+        index.k_hop(
+            node_id,
+            request.args.get("k", 1, type=int),
+            direction_arg(),
+            request.args.get("max_nodes", DEFAULT_MAX_NODES, type=int),
+        )
+    )
+
+
+@app.route("/graph/<pdf_title>/path")
+def get_shortest_path(pdf_title):
+    index = get_graph_index(pdf_title)
+    source = graph_node_arg(index, "source")
+    target = graph_node_arg(index, "target")
+    directed = request.args.get("directed", "false").lower() == "true"
+    path = index.shortest_path(source, target, directed)
+    if path is None:
+        abort(404, description=f"No path between {source} and {target}")
+    return jsonify({"source": source, "target": target, "edges": path})
+
+
+@app.route("/concepts")
+def get_concepts():
+    # The concept graph of a single PDF with ?pdf=<title>, of every PDF otherwise
+    pdf_title = request.args.get("pdf")
+    if pdf_title is not None:
+        get_pdf_graph(pdf_title)
+        return cached_json(
+            (pdf_title, "concepts"), versions[pdf_title], lambda: concepts[pdf_title]
+        )
+    ensure_graphs_loaded()
+    # Merged at startup and at each ingestion; only graphs loaded on demand since
+    # then are merged here
+    version, global_graph = refresh_global_concepts()
+    return cached_json((None, "concepts"), version, lambda: global_graph)
 
 
 @app.route("/send-message", methods=["POST"])
@@ -87,6 +488,10 @@ def receive_message():
     data = request.get_json()
     user_message = data.get("message", "")
 
+    # Chat with the PDF given by title, the current one by default
+    corpus = select_corpus(data.get("pdf") or title_of_pdf)
+    pdf_chatbot = corpus.chatbot
+
     # Execute the chatbot logic
     response = pdf_chatbot.generate_response(user_message)
 
@@ -101,7 +506,7 @@ def receive_message():
     if ranked_documents:
         # Crea una visualizzazione UMAP per la query corrente
         links["Query"] = create_umap_visualization(
-            user_message, title_of_pdf, embedding[0], ranked_documents
+            user_message, corpus.title, corpus.projection, ranked_documents
         )
 
         retrieved_docs = pdf_chatbot.get_doc_info()
@@ -124,7 +529,10 @@ def handle_upload():
     file_name = re.sub(r'[\/\\|*:?<>"]', "", file_name)
 
     # Call the function in the other file
-    elabora_dati(file_name, download_url)
+    result = elabora_dati(file_name, download_url)
+
+    # Serve the new PDF right away
+    merge_ingested_pdf(result)
 
     return jsonify(success=True)
 
@@ -141,9 +549,26 @@ def get_links():
 
 @app.route("/url", methods=["POST"])
 def set_urls():
-    global pdf_chatbot
     data = request.get_json()
-    # Run the chatbot
-    if "url" in data:
-        pdf_chatbot = run_chatbot(data["url"])
+    # Select the PDF of the chat, by title or by URL
+    pdf_title = data.get("pdf")
+    if pdf_title is None and "url" in data:
+        pdf_title = next(
+            (title for title, url in urls.items() if url == data["url"]), None
+        )
+    if pdf_title is not None:
+        select_corpus(pdf_title)
     return urls
+
+
+@app.route("/corpora")
+def get_corpora():
+    return jsonify({**corpus_registry.stats(), "caches": query_cache_stats()})
+
+
+@app.route("/storage/<path:path>")
+def get_artifact(path):
+    # Artifacts of the local storage backend, published for the front end
+    if STORAGE_BACKEND != "local":
+        abort(404)
+    return send_from_directory(storage_backend.root, path)
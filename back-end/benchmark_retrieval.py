@@ -0,0 +1,150 @@
+"""
+Recall benchmark of the retrieval of Documents: dense only (the previous path),
+BM25 only and the hybrid fusion, before the rerank.
+
+Usage:
+    python benchmark_retrieval.py <structure URL or path> [--queries queries.jsonl]
+
+Without a query file, probe queries are drawn from the blocks themselves (their
+title, a sentence, their identifiers) and the relevant document is the block.
+A query file has one JSON object per line: {"query": ..., "relevant": [info, ...]},
+where info is the "block_page" of a document (as shown in the chat sources).
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from Documents import Documents
+from query_cache import query_embeddings
+
+RANKINGS = {
+    "dense": {"dense_weight": 1.0, "lexical_weight": 0.0},
+    "bm25": {"dense_weight": 0.0, "lexical_weight": 1.0},
+    "hybrid": {},
+}
+
+# Section numbers, versions, acronyms and other identifiers
+IDENTIFIER_PATTERN = re.compile(
+    r"\b(?:\d+(?:\.\d+)+|[A-Z]{2,}[A-Za-z0-9]*|\w+[-/_]\w+)\b"
+)
+
+
+def probe_queries(documents: Documents, count: int, seed: int = 0):
+    """
+    Draw probe queries from random blocks.
+
+    Args:
+        documents (Documents): The documents.
+        count (int): The number of blocks drawn.
+        seed (int): The seed of the draw.
+
+    Returns:
+        list: (kind, query, relevant document ids) tuples.
+    """
+    rng = random.Random(seed)
+    doc_ids = rng.sample(range(documents.docs_len), min(count, documents.docs_len))
+    queries = []
+    for doc_id in doc_ids:
+        doc = documents.docs[doc_id]
+        # Blocks with the same text are equally relevant
+        relevant = {
+            other
+            for other, other_doc in enumerate(documents.docs)
+            if other_doc["text"] == doc["text"]
+        }
+        if doc["title"].strip():
+            queries.append(("title", doc["title"], relevant))
+        sentences = [
+            sentence
+            for sentence in re.split(r"(?<=[.!?])\s+", doc["text"])
+            if len(sentence.split()) >= 6
+        ]
+        if sentences:
+            queries.append(("sentence", rng.choice(sentences), relevant))
+        identifiers = list(dict.fromkeys(IDENTIFIER_PATTERN.findall(doc["text"])))
+        if identifiers:
+            queries.append(("identifier", " ".join(identifiers[:3]), relevant))
+    return queries
+
+
+def file_queries(documents: Documents, path: str):
+    """
+    Read labeled queries from a JSON lines file.
+    """
+    doc_ids = {}
+    for doc_id, doc in enumerate(documents.docs):
+        doc_ids.setdefault(doc["info"], set()).add(doc_id)
+
+    queries = []
+    with open(path, "r", encoding="utf-8") as query_file:
+        for line in query_file:
+            if line.strip():
+                item = json.loads(line)
+                relevant = set()
+                for info in item["relevant"]:
+                    relevant |= doc_ids.get(info, set())
+                queries.append(("labeled", item["query"], relevant))
+    return queries
+
+
+def benchmark(documents: Documents, queries: list, ks: list):
+    """
+    Measure the recall at each k and the latency of each ranking.
+
+    Returns:
+        dict: Ranking -> {"recall": {kind: {k: recall}}, "ms": mean latency}.
+    """
+    depth = max(ks)
+    results = {}
+    for name, options in RANKINGS.items():
+        # Every ranking pays for its query embeddings
+        query_embeddings.clear()
+        hits = {}
+        elapsed = 0.0
+        for kind, query, relevant in queries:
+            started = time.perf_counter()
+            ranked = documents.search(query, depth, **options)
+            elapsed += time.perf_counter() - started
+            for k in ks:
+                found = bool(relevant & set(ranked[:k]))
+                hits.setdefault(kind, {}).setdefault(k, []).append(found)
+                hits.setdefault("all", {}).setdefault(k, []).append(found)
+        results[name] = {
+            "recall": {
+                kind: {k: sum(found) / len(found) for k, found in by_k.items()}
+                for kind, by_k in hits.items()
+            },
+            "ms": 1000 * elapsed / len(queries) if queries else 0.0,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("structure", help="URL or path of the document structure")
+    parser.add_argument("--queries", help="JSON lines file of labeled queries")
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 10])
+    args = parser.parse_args()
+
+    documents = Documents(args.structure)
+    if args.queries:
+        queries = file_queries(documents, args.queries)
+    else:
+        queries = probe_queries(documents, args.samples)
+
+    results = benchmark(documents, queries, args.k)
+    kinds = list(next(iter(results.values()))["recall"]) if results else []
+    for kind in kinds:
+        count = sum(1 for query in queries if query[0] == kind or kind == "all")
+        print(f"\n{kind} queries ({count})")
+        print("ranking  " + "".join(f"R@{k:<6}" for k in args.k) + "ms/query")
+        for name, result in results.items():
+            recalls = "".join(f"{result['recall'][kind][k]:<8.3f}" for k in args.k)
+            print(f"{name:<9}{recalls}{result['ms']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
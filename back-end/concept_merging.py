@@ -0,0 +1,227 @@
+import os
+import re
+from collections import Counter
+import hnswlib
+import numpy as np
+from Documents import embedding_provider, embedding_cache
+from embedding_cache import embedding_key
+from logger import logger
+
+# Minimum cosine similarity between two labels of the same concept
+CONCEPT_SIMILARITY = float(os.getenv("CONCEPT_SIMILARITY", "0.92"))
+
+# Neighbours compared with each label
+CONCEPT_NEIGHBORS = 10
+
+
+def normalize_label(label: str):
+    """
+    Normalize a concept label: lower case, no punctuation, single spaces and no
+    plural "s" on the words.
+
+    Args:
+        label (str): The label of a node.
+
+    Returns:
+        str: The normalized label.
+    """
+    words = re.sub(r"[^\w\s]", " ", label.lower()).split()
+    return " ".join(
+        (
+            word[:-1]
+            if len(word) > 3 and word.endswith("s") and not word.endswith("ss")
+            else word
+        )
+        for word in words
+    )
+
+
+def embed_labels(labels: list):
+    """
+    Embed labels with the embedding provider of the documents (Cohere or a local
+    model). The embeddings are kept in the local embedding cache, so the labels
+    embedded when the snapshots were built are not embedded again.
+
+    Args:
+        labels (list): The normalized labels.
+
+    Returns:
+        np.ndarray: The unit-length embeddings, one row per label.
+    """
+    keys = [
+        embedding_key(embedding_provider.name, "clustering", label) for label in labels
+    ]
+    label_embeddings = embedding_cache.get_many(keys)
+    missing = {
+        key: label for key, label in zip(keys, labels) if key not in label_embeddings
+    }
+
+    if missing:
+        embeddings, _ = embedding_provider.embed_documents(
+            list(missing.values()), input_type="clustering"
+        )
+        new_embeddings = {}
+        for key, embedding in zip(missing, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32)
+            new_embeddings[key] = vector / (np.linalg.norm(vector) or 1.0)
+        embedding_cache.put_many(new_embeddings)
+        label_embeddings.update(new_embeddings)
+
+    return np.vstack([label_embeddings[key] for key in keys])
+
+
+class UnionFind:
+    """
+    Disjoint sets of the integers 0..size-1, with path halving and union by size.
+    """
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, item: int):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, first: int, second: int):
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+        if self.size[first] < self.size[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.size[first] += self.size[second]
+
+
+def cluster_labels(labels: list, threshold: float = CONCEPT_SIMILARITY):
+    """
+    Cluster near-duplicate labels: every label is joined to its approximate
+    nearest neighbours whose similarity is above the threshold.
+
+    Args:
+        labels (list): The distinct normalized labels.
+        threshold (float): The minimum cosine similarity.
+
+    Returns:
+        list: The cluster number of each label.
+    """
+    clusters = UnionFind(len(labels))
+
+    if len(labels) > 1:
+        embeddings = embed_labels(labels)
+
+        index = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+        index.init_index(max_elements=len(labels), ef_construction=200, M=16)
+        index.add_items(embeddings, np.arange(len(labels)))
+
+        k = min(CONCEPT_NEIGHBORS + 1, len(labels))
+        index.set_ef(max(50, k))
+        neighbors, distances = index.knn_query(embeddings, k=k)
+
+        # The "ip" distance is 1 - similarity
+        for label, (row, row_distances) in enumerate(zip(neighbors, distances)):
+            for neighbor, distance in zip(row, row_distances):
+                if neighbor != label and 1.0 - distance >= threshold:
+                    clusters.union(label, int(neighbor))
+
+    return [clusters.find(label) for label in range(len(labels))]
+
+
+def merge_concepts(members_by_pdf: dict):
+    """
+    Merge the block graphs (members) of one or more PDFs into a deduplicated
+    concept graph, joining the nodes whose labels are near-duplicates.
+
+    Args:
+        members_by_pdf (dict): PDF title -> members of the PDF.
+
+    Returns:
+        dict: The concept graph ("initialNodes", "initialEdges") and its "stats",
+              with the reduction ratio of the nodes and edges.
+    """
+    # Occurrences of each original label, and the PDFs and blocks using it
+    label_counts = Counter()
+    label_pdfs = {}
+    block_edges = []
+    nodes_before = 0
+
+    for pdf_title, pdf_members in members_by_pdf.items():
+        for block_graph in pdf_members.values():
+            block_labels = {node["id"] for node in block_graph.get("initialNodes", [])}
+            edges = list(block_graph.get("initialEdges", []))
+            for edge in edges:
+                block_labels.update((edge["source"], edge["target"]))
+            nodes_before += len(block_labels)
+            for label in block_labels:
+                label_counts[label] += 1
+                label_pdfs.setdefault(label, set()).add(pdf_title)
+            block_edges.extend(edges)
+
+    # Labels equal after normalization are merged without embedding them
+    normalized = {label: normalize_label(label) for label in label_counts}
+    distinct = sorted(set(normalized.values()))
+    cluster_of = dict(zip(distinct, cluster_labels(distinct)))
+
+    members_of = {}
+    for label in label_counts:
+        members_of.setdefault(cluster_of[normalized[label]], []).append(label)
+
+    # The most frequent spelling (then the shortest) names the concept
+    concept = {}
+    nodes = []
+    for labels in members_of.values():
+        name = min(labels, key=lambda label: (-label_counts[label], len(label), label))
+        for label in labels:
+            concept[label] = name
+        nodes.append(
+            {
+                "id": name,
+                "data": {
+                    "label": name,
+                    "aliases": sorted(label for label in labels if label != name),
+                    "pdfs": sorted(
+                        set().union(*(label_pdfs[label] for label in labels))
+                    ),
+                    "blocks": sum(label_counts[label] for label in labels),
+                },
+            }
+        )
+
+    edges = {}
+    for edge in block_edges:
+        source, target = concept[edge["source"]], concept[edge["target"]]
+        if source == target:
+            continue
+        merged = edges.get((source, target))
+        if merged is None:
+            edges[(source, target)] = {
+                "id": source + "_" + target,
+                "source": source,
+                "target": target,
+                "label": edge.get("label", ""),
+                "animated": "true",
+                "data": {"weight": 1},
+            }
+        else:
+            merged["data"]["weight"] += 1
+
+    nodes.sort(key=lambda node: node["id"])
+    stats = {
+        "nodes_before": nodes_before,
+        "nodes_after": len(nodes),
+        "edges_before": len(block_edges),
+        "edges_after": len(edges),
+        "node_reduction": 1 - len(nodes) / nodes_before if nodes_before else 0.0,
+        "edge_reduction": 1 - len(edges) / len(block_edges) if block_edges else 0.0,
+    }
+    logger.info(
+        f"Concepts of {', '.join(members_by_pdf)} merged: "
+        f"nodes {stats['nodes_before']} -> {stats['nodes_after']} "
+        f"({stats['node_reduction']:.1%} reduction), "
+        f"edges {stats['edges_before']} -> {stats['edges_after']} "
+        f"({stats['edge_reduction']:.1%} reduction)"
+    )
+
+    return {"initialNodes": nodes, "initialEdges": list(edges.values()), "stats": stats}
@@ -0,0 +1,183 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from Documents import Documents
+from Chatbot import Chatbot
+from umap_visualization import create_initial_umap_visualization
+from query_cache import retrieval_results
+from logger import logger
+
+# Memory budget of the corpora kept loaded, in MB
+CORPUS_MEMORY_BUDGET_MB = int(os.getenv("CORPUS_MEMORY_BUDGET_MB", "1024"))
+
+# Bytes of the links of each element in the hnswlib index (M=64, level 0)
+INDEX_LINK_BYTES = 2 * 64 * 4
+
+
+class Corpus:
+    """
+    Everything loaded for the retrieval over a PDF, shared by all its consumers.
+
+    Parameters:
+    title (str): The title of the PDF.
+    url (str): The URL of the document structure of the PDF.
+
+    Attributes:
+    documents (Documents): The documents, their embeddings and index.
+    chatbot (Chatbot): The chatbot answering over the documents.
+    umap_link (str): The URL of the UMAP plot of the documents.
+    projection: The UMAP projection of the embeddings of the documents.
+    """
+
+    def __init__(self, title: str, url: str):
+        self.title = title
+        self.url = url
+        self.documents = Documents(url)
+        self.chatbot = Chatbot(self.documents)
+        self.umap_link = None
+        self.projection = None
+        self.lock = threading.Lock()
+
+    def ensure_projection(self):
+        """
+        Compute the UMAP projection (and its plot) on first use.
+
+        Returns:
+            tuple: The URL of the plot and the projection.
+        """
+        with self.lock:
+            if self.projection is None:
+                self.umap_link, self.projection = create_initial_umap_visualization(
+                    self.documents.docs_embs, self.title
+                )
+        return self.umap_link, self.projection
+
+    def memory_usage(self):
+        """
+        Estimate the bytes held by the corpus: texts, embeddings, index and projection.
+        """
+        docs = self.documents.docs
+        size = sum(
+            sys.getsizeof(doc["title"]) + sys.getsizeof(doc["text"]) for doc in docs
+        )
+        embeddings = self.documents.docs_embs
+        if embeddings:
+            # The index holds a copy of each vector plus its links
+            vector_bytes = embeddings[0].nbytes
+            size += len(embeddings) * (2 * vector_bytes + INDEX_LINK_BYTES)
+        if self.projection is not None:
+            size += self.projection.nbytes
+        return size
+
+
+class CorpusRegistry:
+    """
+    One Corpus per PDF, kept within a memory budget: the least recently used
+    corpora are evicted when the budget is exceeded.
+
+    Parameters:
+    budget_mb (int): The memory budget in MB.
+    """
+
+    def __init__(self, budget_mb: int = CORPUS_MEMORY_BUDGET_MB):
+        self.budget = budget_mb * 1024 * 1024
+        self.corpora = OrderedDict()
+        self.sizes = {}
+        self.lock = threading.Lock()
+        # One lock per title, so a corpus is never built twice at the same time
+        self.build_locks = {}
+
+    def get(self, title: str, url: str):
+        """
+        Return the corpus of a PDF, building it if needed.
+
+        Args:
+            title (str): The title of the PDF.
+            url (str): The URL of the document structure of the PDF.
+
+        Returns:
+            Corpus: The corpus.
+        """
+        with self.lock:
+            corpus = self.corpora.get(title)
+            if corpus is not None and corpus.url == url:
+                self.corpora.move_to_end(title)
+                return corpus
+            build_lock = self.build_locks.setdefault(title, threading.Lock())
+
+        with build_lock:
+            with self.lock:
+                corpus = self.corpora.get(title)
+                if corpus is not None and corpus.url == url:
+                    self.corpora.move_to_end(title)
+                    return corpus
+
+            corpus = Corpus(title, url)
+
+            with self.lock:
+                replaced = self.corpora.get(title)
+                if replaced is not None:
+                    retrieval_results.invalidate(replaced.documents.corpus_version)
+                self.corpora[title] = corpus
+                self.corpora.move_to_end(title)
+                self.sizes[title] = corpus.memory_usage()
+                self._evict(keep=title)
+        return corpus
+
+    def evict(self, title: str):
+        """
+        Drop the corpus of a PDF (e.g. re-ingested under the same title, so with
+        the same URL), waiting for a build in progress.
+
+        Args:
+            title (str): The title of the PDF.
+        """
+        with self.lock:
+            build_lock = self.build_locks.setdefault(title, threading.Lock())
+        with build_lock:
+            with self.lock:
+                if title in self.corpora:
+                    self._remove(title)
+
+    def update_size(self, title: str):
+        """
+        Measure again the memory of a corpus (e.g. after its UMAP projection).
+        """
+        with self.lock:
+            if title in self.corpora:
+                self.sizes[title] = self.corpora[title].memory_usage()
+                self._evict(keep=title)
+
+    def _evict(self, keep: str):
+        """
+        Evict the least recently used corpora until the budget is respected.
+        """
+        while sum(self.sizes.values()) > self.budget and len(self.corpora) > 1:
+            title = next(iter(self.corpora))
+            if title == keep:
+                break
+            self._remove(title)
+
+    def _remove(self, title: str):
+        """
+        Remove a corpus and its cached retrieval results.
+        """
+        corpus = self.corpora.pop(title)
+        retrieval_results.invalidate(corpus.documents.corpus_version)
+        size = self.sizes.pop(title)
+        logger.info(f"Corpus of '{title}' evicted ({size} bytes).")
+
+    def stats(self):
+        """
+        Return the loaded corpora (least recently used first) and their memory.
+        """
+        with self.lock:
+            return {
+                "budget": self.budget,
+                "used": sum(self.sizes.values()),
+                "corpora": [
+                    {"title": title, "bytes": self.sizes[title]}
+                    for title in self.corpora
+                ],
+            }
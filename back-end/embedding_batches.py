@@ -0,0 +1,155 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import tiktoken
+from logger import logger
+from tracing import run_in_context, increment_span_attribute
+
+# Concurrent embedding requests
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 4))
+
+# Limits of each request: number of texts and (estimated) tokens
+EMBED_BATCH_SIZE = 90
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 32000))
+
+EMBED_RETRIES = 5
+EMBED_BACKOFF = 1.0
+
+# Connection errors and timeouts, of the standard library and of the HTTP clients
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+try:
+    # HTTP client of the recent Cohere SDKs
+    import httpx
+
+    TRANSIENT_ERRORS += (httpx.TransportError,)
+except ImportError:
+    pass
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base"):
+    """
+    Estimate the number of tokens of a text (the tokenizer of the embedding model
+    is not public).
+    """
+    encoding = tiktoken.get_encoding(encoding_name)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def make_batches(
+    token_counts: list,
+    max_items: int = EMBED_BATCH_SIZE,
+    max_tokens: int = EMBED_BATCH_TOKENS,
+):
+    """
+    Split a list of texts into consecutive batches respecting both the item limit
+    and the token budget (a text larger than the budget gets a batch of its own).
+
+    Args:
+        token_counts (list): The number of tokens of each text.
+        max_items (int): The maximum number of texts of a batch.
+        max_tokens (int): The maximum number of tokens of a batch.
+
+    Returns:
+        list: The (start, stop) ranges of the batches.
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for position, count in enumerate(token_counts):
+        if position > start and (
+            position - start >= max_items or tokens + count > max_tokens
+        ):
+            batches.append((start, position))
+            start, tokens = position, 0
+        tokens += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+def _is_retryable(error: Exception):
+    """
+    Tell whether a failed request should be retried: rate limits, server errors,
+    connection errors and timeouts. Any other error is raised at once.
+    """
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def _embed_batch(embed, texts: list):
+    """
+    Embed a batch, retrying with exponential backoff and jitter.
+    """
+    for attempt in range(EMBED_RETRIES):
+        try:
+            return embed(texts)
+        except Exception as e:
+            if attempt == EMBED_RETRIES - 1 or not _is_retryable(e):
+                raise
+            delay = EMBED_BACKOFF * 2**attempt * (1 + random.random())
+            logger.warning(
+                f"Embedding of {len(texts)} texts failed ({e}), retrying in {delay:.1f}s"
+            )
+            increment_span_attribute("embed_retries", 1)
+            time.sleep(delay)
+
+
+def embed_concurrently(texts: list, embed, on_batch=None):
+    """
+    Embed texts with concurrent, token-bounded batch requests, reassembling the
+    embeddings in the order of the texts.
+
+    Args:
+        texts (list): The texts to embed.
+        embed (callable): Embeds a list of texts, returning their embeddings.
+        on_batch (callable): Called with (start, embeddings) after each batch, so
+                             that the finished batches survive a later failure.
+
+    Returns:
+        tuple: The embeddings (one per text) and the throughput statistics.
+    """
+    token_counts = [count_tokens(text) for text in texts]
+    batches = make_batches(token_counts)
+
+    def _run_batch(start, stop):
+        embeddings = _embed_batch(embed, texts[start:stop])
+        if on_batch is not None:
+            on_batch(start, embeddings)
+        return embeddings
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+        futures = [
+            executor.submit(run_in_context(lambda s=start, e=stop: _run_batch(s, e)))
+            for start, stop in batches
+        ]
+        embeddings = [embedding for future in futures for embedding in future.result()]
+    seconds = time.perf_counter() - started
+
+    tokens = sum(token_counts)
+    stats = {
+        "texts": len(texts),
+        "tokens": tokens,
+        "batches": len(batches),
+        "seconds": seconds,
+        "texts_per_second": len(texts) / seconds if seconds else 0.0,
+        "tokens_per_second": tokens / seconds if seconds else 0.0,
+    }
+    if texts:
+        logger.info(
+            f"Embedded {len(texts)} texts (~{tokens} tokens) in {len(batches)} batches "
+            f"in {seconds:.2f}s: {stats['texts_per_second']:.1f} texts/s, "
+            f"{stats['tokens_per_second']:.0f} tokens/s"
+        )
+    increment_span_attribute("embedded_texts", len(texts))
+    increment_span_attribute("embedded_tokens", tokens)
+    return embeddings, stats
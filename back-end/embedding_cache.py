@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import hnswlib
+import numpy as np
+from logger import logger
+
+# Folder of the embedding store and of the saved hnswlib indexes
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+
+
+def embedding_key(model: str, input_type: str, text: str):
+    """
+    Return the key of the embedding of a text: the hash of its content, the
+    model and the input type.
+
+    Args:
+        model (str): The embedding model.
+        input_type (str): The Cohere input type (e.g. "search_document").
+        text (str): The embedded text.
+
+    Returns:
+        str: The key.
+    """
+    return hashlib.sha256(f"{model}\0{input_type}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Local store of the embeddings (SQLite), keyed by embedding_key.
+
+    Parameters:
+    folder (str): The folder of the store.
+    """
+
+    def __init__(self, folder: str = EMBEDDING_CACHE_DIR):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            os.path.join(folder, "embeddings.sqlite3"), check_same_thread=False
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self.connection.commit()
+
+    def get_many(self, keys: list):
+        """
+        Return the cached embeddings of some keys.
+
+        Args:
+            keys (list): The keys.
+
+        Returns:
+            dict: Key -> embedding (np.ndarray) for the keys found.
+        """
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self.lock:
+            # SQLite limits the number of parameters of a query
+            for i in range(0, len(unique), 500):
+                batch = unique[i : i + 500]
+                rows = self.connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                )
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: dict):
+        """
+        Store embeddings.
+
+        Args:
+            items (dict): Key -> embedding.
+        """
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in items.items()
+                ],
+            )
+            self.connection.commit()
+
+    def index_paths(self, corpus_key: str):
+        """
+        Return the paths of the saved index of a corpus and of its manifest.
+        """
+        folder = os.path.join(self.folder, "indexes")
+        os.makedirs(folder, exist_ok=True)
+        return (
+            os.path.join(folder, f"{corpus_key}.bin"),
+            os.path.join(folder, f"{corpus_key}.json"),
+        )
+
+    def load_index(self, corpus_key: str, manifest: dict):
+        """
+        Load the saved hnswlib index of a corpus, if its manifest matches.
+
+        Args:
+            corpus_key (str): The hash of the embedding keys of the corpus.
+            manifest (dict): The expected parameters of the index.
+
+        Returns:
+            hnswlib.Index: The index, or None if missing or built differently.
+        """
+        index_path, manifest_path = self.index_paths(corpus_key)
+        try:
+            with open(manifest_path, "r") as manifest_file:
+                saved = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+        if any(saved.get(key) != value for key, value in manifest.items()):
+            return None
+
+        index = hnswlib.Index(space=manifest["space"], dim=manifest["dim"])
+        try:
+            index.load_index(index_path, max_elements=manifest["count"])
+        except RuntimeError as e:
+            logger.error(f"Unable to load the index {index_path}: {e}")
+            return None
+        return index
+
+    def save_index(self, corpus_key: str, index, manifest: dict):
+        """
+        Save the hnswlib index of a corpus beside its manifest. The manifest is
+        written last, so a partially saved index is never loaded.
+
+        Args:
+            corpus_key (str): The hash of the embedding keys of the corpus.
+            index (hnswlib.Index): The index.
+            manifest (dict): The parameters of the index.
+        """
+        index_path, manifest_path = self.index_paths(corpus_key)
+        index.save_index(index_path)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(manifest_path))
+        with os.fdopen(fd, "w") as manifest_file:
+            json.dump({**manifest, "created": time.time()}, manifest_file)
+        os.replace(tmp_path, manifest_path)
+
+
+def corpus_key(keys: list):
+    """
+    Return the key of a corpus: the hash of the embedding keys of its documents, in order.
+    """
+    return hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()
@@ -0,0 +1,195 @@
+import os
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+from embedding_batches import embed_concurrently
+from logger import logger
+
+# Provider of the embeddings of the documents and queries: "cohere" or "local"
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "cohere")
+
+# Sentence-transformer model of the local provider
+LOCAL_EMBED_MODEL = os.getenv(
+    "LOCAL_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+
+# Runtime of the local model: "torch" or "onnx"
+LOCAL_EMBED_BACKEND = os.getenv("LOCAL_EMBED_BACKEND", "torch")
+
+# ONNX file of the local model, e.g. "onnx/model_qint8_avx512_vnni.onnx" for int8
+LOCAL_EMBED_ONNX_FILE = os.getenv("LOCAL_EMBED_ONNX_FILE", "")
+
+# Texts encoded at once by the local model
+LOCAL_EMBED_BATCH_SIZE = int(os.getenv("LOCAL_EMBED_BATCH_SIZE", "64"))
+
+
+class EmbeddingProvider(ABC):
+    """
+    Interface of the embedding providers used by the retrieval.
+
+    Attributes:
+    name (str): Identifies the model and its settings; the cached embeddings and
+                saved indexes are keyed by it.
+    dim (int): The dimension of the embeddings.
+    """
+
+    name = None
+    dim = None
+
+    @abstractmethod
+    def embed_documents(
+        self, texts: list, on_batch=None, input_type: str = "search_document"
+    ):
+        """
+        Embed the texts of documents.
+
+        Args:
+            texts (list): The texts.
+            on_batch (callable): Called with (start, embeddings) after each batch.
+            input_type (str): The use of the embeddings, "search_document" or
+                              "clustering" (ignored by the models without it).
+
+        Returns:
+            tuple: The embeddings (one per text) and the throughput statistics.
+        """
+
+    @abstractmethod
+    def embed_query(self, query: str):
+        """
+        Embed a search query.
+
+        Args:
+            query (str): The query.
+
+        Returns:
+            np.ndarray: The embedding (float32).
+        """
+
+
+class CohereProvider(EmbeddingProvider):
+    """
+    Embeddings computed by the Cohere API.
+
+    Parameters:
+    client (cohere.Client): The Cohere client.
+    model (str): The Cohere embedding model.
+    """
+
+    def __init__(self, client, model: str = "embed-english-v3.0", dim: int = 1024):
+        self.client = client
+        self.name = model
+        self.dim = dim
+
+    def embed_documents(
+        self, texts: list, on_batch=None, input_type: str = "search_document"
+    ):
+        return embed_concurrently(
+            texts,
+            lambda batch: self.client.embed(
+                texts=batch, model=self.name, input_type=input_type
+            ).embeddings,
+            on_batch=on_batch,
+        )
+
+    def embed_query(self, query: str):
+        embeddings = self.client.embed(
+            texts=[query], model=self.name, input_type="search_query"
+        ).embeddings
+        return np.asarray(embeddings[0], dtype=np.float32)
+
+
+class LocalProvider(EmbeddingProvider):
+    """
+    Embeddings computed on the CPU by a sentence-transformer model, in batches,
+    optionally with ONNX Runtime (and an int8 quantized ONNX file). The embeddings
+    are normalized, so the inner product of the index is the cosine similarity.
+
+    Parameters:
+    model (str): The sentence-transformer model.
+    backend (str): "torch" or "onnx".
+    onnx_file (str): The ONNX file of the model (e.g. a quantized one).
+    batch_size (int): The texts encoded at once.
+    """
+
+    def __init__(
+        self,
+        model: str = LOCAL_EMBED_MODEL,
+        backend: str = LOCAL_EMBED_BACKEND,
+        onnx_file: str = LOCAL_EMBED_ONNX_FILE,
+        batch_size: int = LOCAL_EMBED_BATCH_SIZE,
+    ):
+        # Optional dependency, only needed by the local provider
+        from sentence_transformers import SentenceTransformer
+
+        options = {"device": "cpu"}
+        if backend != "torch":
+            options["backend"] = backend
+            if onnx_file:
+                options["model_kwargs"] = {"file_name": onnx_file}
+        self.model = SentenceTransformer(model, **options)
+        self.batch_size = batch_size
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+        # Other runtimes and quantized files give (slightly) different embeddings
+        self.name = f"local:{model}"
+        if backend != "torch":
+            self.name += f":{backend}"
+            if onnx_file:
+                self.name += f":{onnx_file}"
+        logger.info(f"Local embedding model {self.name} loaded (dim {self.dim}).")
+
+    def _encode(self, texts: list):
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).astype(np.float32)
+
+    def embed_documents(
+        self, texts: list, on_batch=None, input_type: str = "search_document"
+    ):
+        started = time.perf_counter()
+        embeddings = []
+        # Stored by chunks, so that the finished ones survive a later failure
+        chunk = self.batch_size * 16
+        for start in range(0, len(texts), chunk):
+            chunk_embeddings = list(self._encode(texts[start : start + chunk]))
+            if on_batch is not None:
+                on_batch(start, chunk_embeddings)
+            embeddings.extend(chunk_embeddings)
+        seconds = time.perf_counter() - started
+
+        stats = {
+            "texts": len(texts),
+            "batches": -(-len(texts) // self.batch_size),
+            "seconds": seconds,
+            "texts_per_second": len(texts) / seconds if seconds else 0.0,
+        }
+        if texts:
+            logger.info(
+                f"Embedded {len(texts)} texts locally in {seconds:.2f}s: "
+                f"{stats['texts_per_second']:.1f} texts/s"
+            )
+        return embeddings, stats
+
+    def embed_query(self, query: str):
+        return self._encode([query])[0]
+
+
+def get_embedding_provider(client, provider: str = EMBED_PROVIDER):
+    """
+    Create the configured embedding provider.
+
+    Args:
+        client (cohere.Client): The Cohere client (used by the "cohere" provider).
+        provider (str): "cohere" or "local".
+
+    Returns:
+        EmbeddingProvider: The provider.
+    """
+    if provider == "local":
+        return LocalProvider()
+    if provider != "cohere":
+        raise ValueError(f"Unknown embedding provider: {provider}")
+    return CohereProvider(client)
@@ -1,6 +1,16 @@
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import hashlib
+import json
 import os
-import pyrebase
+import random
+import tempfile
+import threading
+import time
+from logger import logger
+from tracing import run_in_context, increment_span_attribute
+from storage_backends import FirebaseStorage, LocalStorage, open_artifact
 
 load_dotenv(verbose=True)
 
@@ -26,62 +36,229 @@ firebaseConfig = {
     "measurementId": MEASUREMENT_ID,
 }
 
-# Initialize Firebase
-firebase = pyrebase.initialize_app(firebaseConfig)
+# Upload configuration
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 8))
+UPLOAD_RETRIES = 4
+UPLOAD_BACKOFF = 0.5
+UPLOAD_MANIFEST = os.getenv("UPLOAD_MANIFEST", "upload_manifest.json")
 
-# Retrieve configuration for Firebase Storage service
-storage = firebase.storage()
+# Storage configuration: "firebase" or "local"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "storage")
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "http://localhost:5002/storage")
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "artifact_cache")
+
+# Initialize the storage backend
+if STORAGE_BACKEND == "local":
+    storage_backend = LocalStorage(LOCAL_STORAGE_ROOT, LOCAL_STORAGE_URL)
+else:
+    storage_backend = FirebaseStorage(
+        firebaseConfig, ARTIFACT_CACHE_DIR, UPLOAD_WORKERS
+    )
+logger.info(f"Using the {STORAGE_BACKEND} storage backend")
+
+# Manifest of the uploaded files: backend:destination path -> {"hash": ..., "url": ...}
+_manifest_lock = threading.Lock()
+_manifest_save_lock = threading.Lock()
+upload_manifest = {}
+if os.path.exists(UPLOAD_MANIFEST):
+    try:
+        with open(UPLOAD_MANIFEST, encoding="utf-8") as manifest_file:
+            upload_manifest = json.load(manifest_file)
+    except (OSError, ValueError) as e:
+        # The files are uploaded again rather than preventing the start
+        logger.error(f"Unreadable upload manifest {UPLOAD_MANIFEST} ({e}), ignoring it")
+
+
+def file_hash(file_path: str):
+    """
+    Compute the SHA-256 hash of a file's content.
+
+    Args:
+        file_path (str): The path of the file.
+
+    Returns:
+        str: The hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_manifest():
+    """
+    Write the manifest atomically: to a temporary file replacing the previous one.
+    """
+    with _manifest_save_lock:
+        with _manifest_lock:
+            manifest = dict(upload_manifest)
+        directory = os.path.dirname(os.path.abspath(UPLOAD_MANIFEST))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as manifest_file:
+                json.dump(manifest, manifest_file)
+            os.replace(temp_path, UPLOAD_MANIFEST)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+def _upload(file_path: str, destination_path: str):
+    """
+    Upload a file to the storage backend, retrying with exponential backoff.
+    The upload is skipped only when the same content was already uploaded to
+    the same destination path. The manifest is updated in memory only.
+
+    Args:
+        file_path (str): The local path of the file.
+        destination_path (str): The destination path on Firebase Storage.
+
+    Returns:
+        str: The URL of the file on Firebase Storage.
+    """
+    # The same path on another backend does not count
+    manifest_key = f"{STORAGE_BACKEND}:{destination_path}"
+    content_hash = file_hash(file_path)
+
+    with _manifest_lock:
+        entry = upload_manifest.get(manifest_key)
+    if entry is not None and entry["hash"] == content_hash:
+        increment_span_attribute("skipped", 1)
+        return entry["url"]
+
+    for attempt in range(UPLOAD_RETRIES):
+        try:
+            url = storage_backend.put(file_path, destination_path)
+            break
+        except requests.exceptions.RequestException as e:
+            if attempt == UPLOAD_RETRIES - 1:
+                raise
+            delay = UPLOAD_BACKOFF * 2**attempt * (1 + random.random())
+            logger.warning(
+                f"Upload of {destination_path} failed ({e}), retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+    with _manifest_lock:
+        # Replaces the entry of the content previously stored at this path
+        upload_manifest[manifest_key] = {"hash": content_hash, "url": url}
+
+    increment_span_attribute("uploaded", 1)
+    increment_span_attribute("bytes", os.path.getsize(file_path))
+    return url
+
+
+def upload_file(file_path: str, destination_path: str):
+    """
+    Upload a file to the storage backend, skipping it when the same content is
+    already stored at the same destination path.
+
+    Args:
+        file_path (str): The local path of the file.
+        destination_path (str): The destination path on Firebase Storage.
+
+    Returns:
+        str: The URL of the file on Firebase Storage.
+    """
+    return upload_files([(file_path, destination_path)])[0]
+
+
+def upload_files(files: list):
+    """
+    Upload several files concurrently with a bounded worker pool, writing the
+    manifest once for the whole batch.
+
+    Args:
+        files (list): A list of (local path, destination path) tuples.
+
+    Returns:
+        list: The URLs of the files, in the same order as the input.
+    """
+    if not files:
+        return []
+
+    try:
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            futures = [
+                executor.submit(
+                    run_in_context(lambda f=file_path, d=destination: _upload(f, d))
+                )
+                for file_path, destination in files
+            ]
+            return [future.result() for future in futures]
+    finally:
+        # The finished uploads are kept even when another one failed
+        _save_manifest()
 
 
 def upload_umap_to_firebase(umap: str):
     # Percorso del file nell'archivio Firebase Storage
     path_on_cloud = "umap/" + umap
 
-    # Upload the image file to Firebase Storage
-    storage.child(path_on_cloud).put(umap)
-
-    # Get the link for the newly uploaded file
-    return storage.child(path_on_cloud).get_url(None)
+    # Upload the image file to Firebase Storage and get its link
+    return upload_file(umap, path_on_cloud)
 
 
-def upload_images_to_firebase(pdf_name: str):
+def upload_images_to_firebase(
+    pdf_name: str, page_images: dict = None, image_variants: dict = None
+):
     """
     Upload images associated with a PDF document to Firebase Storage and return the URLs of the images.
 
     Args:
         pdf_name (str): The name of the PDF document (without extension) for which to upload images.
+        page_images (dict, optional): Page number -> list of image file names, for images
+            shared between pages. Defaults to the page number found in each file name.
+        image_variants (dict, optional): Image file name -> {variant: relative path}, as
+            returned by create_image_variants. When given, the variants are uploaded too.
 
     Returns:
-        dict: A dictionary containing image URLs for each page of the PDF.
+        dict: A dictionary containing image URLs for each page of the PDF. With image_variants,
+            each image is a dictionary with the "original" URL and one URL per variant.
     """
 
     # Get the list of image files in the specified path
     image_folder = f"{pdf_name}_images"
     image_files = [file for file in os.listdir(image_folder) if file.endswith((".png"))]
+    image_files.sort()
 
-    # Dictionary to store image URLs for each page
-    image_urls_dict = {}
+    if page_images is None:
+        page_images = {}
+        for image_file in image_files:
+            # Get the page number from the image file name
+            page_num = int(image_file.split("_")[1])
+            page_images.setdefault(page_num, []).append(image_file)
 
-    # Upload each image file to Firebase Storage
+    # Originals and their variants, as paths relative to the image folder
+    files = list(image_files)
     for image_file in image_files:
-        image_path = os.path.join(image_folder, image_file)
-
-        # Specify the destination path on Firebase Storage
-        destination_path = f"images/{pdf_name}/{image_file}"
-
-        # Upload the image file to Firebase Storage
-        storage.child(destination_path).put(image_path)
-
-        # Get the link for the newly uploaded file
-        image_url = storage.child(destination_path).get_url(None)
+        files.extend((image_variants or {}).get(image_file, {}).values())
 
-        # Get the page number from the image file URL
-        page_num = int(image_file.split("_")[1])
+    # Upload each distinct image file to Firebase Storage concurrently
+    image_urls = upload_files(
+        [
+            (
+                os.path.join(image_folder, file),
+                f"images/{pdf_name}/{file.replace(os.sep, '/')}",
+            )
+            for file in files
+        ]
+    )
+    url_by_file = dict(zip(files, image_urls))
 
-        # Add the URL to the list of URLs for the corresponding page
-        if page_num not in image_urls_dict:
-            image_urls_dict[page_num] = []
-        image_urls_dict[page_num].append(image_url)
+    # Dictionary to store image URLs for each page
+    image_urls_dict = {}
+    for page_num, page_files in page_images.items():
+        for image_file in page_files:
+            if image_variants is None:
+                image_url = url_by_file[image_file]
+            else:
+                image_url = {"original": url_by_file[image_file]}
+                for variant, variant_file in image_variants.get(image_file, {}).items():
+                    image_url[variant] = url_by_file[variant_file]
+            image_urls_dict.setdefault(page_num, []).append(image_url)
 
     # Return the dictionary of image URLs
     return image_urls_dict
@@ -104,11 +281,22 @@ def upload_json_to_firebase(file_name: str):
     # Specify the destination path on Firebase Storage
     destination_path = f"JSON/{file_name}"
 
-    # Upload the JSON file to Firebase Storage
-    storage.child(destination_path).put(file_path)
-
-    # Get the link for the newly uploaded JSON file
-    json_url = storage.child(destination_path).get_url(None)
+    # Upload the JSON file to Firebase Storage and get its link
+    json_url = upload_file(file_path, destination_path)
 
     # Return the URL of the JSON file on Firebase
     return json_url
+
+
+def read_artifact(url: str):
+    """
+    Open a stored artifact for reading, directly from the local disk when the
+    storage backend has a local copy, otherwise over HTTP.
+
+    Args:
+        url (str): The public URL of the artifact.
+
+    Returns:
+        file: A binary file-like object, to be closed by the caller.
+    """
+    return open_artifact(storage_backend, url)
@@ -1,8 +1,51 @@
-initial_start_page_value = []
+from bisect import insort
+
+
+class IndexedList:
+    """
+    A list of nodes or edges indexed by id, to check in constant time whether an
+    identical element was already added.
+
+    Parameters:
+    items (list): The list to fill, which stays a plain list for serialization.
+    key (function): Function returning the id of an element.
+
+    Attributes:
+    items (list): The elements, in insertion order.
+    by_id (dict): Id -> elements with that id (usually one).
+    """
+
+    def __init__(self, items: list, key=lambda item: item["id"]):
+        self.items = items
+        self.key = key
+        self.by_id = {}
+        for item in items:
+            self.by_id.setdefault(key(item), []).append(item)
+
+    def add(self, item: dict):
+        """
+        Add an element unless an identical one already exists.
+
+        Returns:
+            bool: True if the element was added.
+        """
+        same_id = self.by_id.setdefault(self.key(item), [])
+        if item in same_id:
+            return False
+        same_id.append(item)
+        self.items.append(item)
+        return True
 
 
 def create_handle_node(
-    id: str, data: str, url: str, lista: list, tipi: list, expanded: bool
+    id: str,
+    data: str,
+    url: str,
+    lista: IndexedList,
+    tipi: IndexedList,
+    expanded: bool,
+    original: str = None,
+    display: str = None,
 ):
     """
     Create a 'handle' node and add it to the lists if it doesn't already exist.
@@ -11,8 +54,10 @@ def create_handle_node(
         id (str): Unique identifier for the node.
         data (str): Node label.
         url (str): URL associated with the node.
-        list (list): List of nodes.
-        types (list): List of node types.
+        list (IndexedList): List of nodes.
+        types (IndexedList): List of node types.
+        original (str, optional): URL of the full-size image, offered for download.
+        display (str, optional): URL of the compressed image opened on click.
 
     Returns:
         None
@@ -29,22 +74,25 @@ def create_handle_node(
         },
     }
 
+    if original is not None:
+        node["data"]["original"] = original
+    if display is not None:
+        node["data"]["display"] = display
+
     nodeType = {id: url}
 
-    # Check if the node type already exists in the list before adding it
-    if nodeType not in tipi:
-        tipi.append(nodeType)
+    # Add the node type unless it already exists in the list
+    tipi.add(nodeType)
 
-    # Check if the node already exists in the list before adding it
-    if node not in lista:
-        lista.append(node)
+    # Add the node unless it already exists in the list
+    lista.add(node)
 
 
 def create_node(
     id: str,
     data: str,
     order: float,
-    lista: list,
+    lista: IndexedList,
     page: int,
     section: str,
     expanded: bool,
@@ -57,13 +105,13 @@ def create_node(
         id (str): Unique identifier for the node.
         data (str): Node label.
         order (float): Node order.
-        list (list): List of nodes.
+        list (IndexedList): List of nodes.
         page (int): Page number.
         section (str): Node section.
         id (str): Unique identifier for the node.
         data (str): Node label.
         order (float): Node order.
-        list (list): List of nodes.
+        list (IndexedList): List of nodes.
         page (int): Page number.
         section (str): Node section.
 
@@ -87,9 +135,8 @@ def create_node(
         },
     }
 
-    # Check if the node already exists in the list before adding it
-    if node not in lista:
-        lista.append(node)
+    # Add the node unless it already exists in the list
+    lista.add(node)
 
 
 def create_paragraph_node(
@@ -98,7 +145,7 @@ def create_paragraph_node(
     text: str,
     section: str,
     page: int,
-    lista: list,
+    lista: IndexedList,
     order: float,
     expanded: bool,
 ):
@@ -111,7 +158,7 @@ def create_paragraph_node(
         text (str): Text associated with the node.
         section (str): Document section.
         page (int): Page number.
-        list (list): List of nodes.
+        list (IndexedList): List of nodes.
         order (float): Node order.
 
     Returns:
@@ -134,13 +181,11 @@ def create_paragraph_node(
         },
     }
 
-    # Check if the node already exists in the list before adding it
-    # Check if the node already exists in the list before adding it
-    if node not in lista:
-        lista.append(node)
+    # Add the node unless it already exists in the list
+    lista.add(node)
 
 
-def create_edge(id: str, source: str, target: str, label: str, lista: list):
+def create_edge(id: str, source: str, target: str, label: str, lista: IndexedList):
     """
     Create an edge and add it to the list if it doesn't already exist.
 
@@ -149,7 +194,7 @@ def create_edge(id: str, source: str, target: str, label: str, lista: list):
         source (str): Source node of the edge.
         target (str): Target node of the edge.
         label (str): Edge label.
-        list (list): List of edges.
+        list (IndexedList): List of edges.
 
     Returns:
         None
@@ -163,162 +208,264 @@ def create_edge(id: str, source: str, target: str, label: str, lista: list):
         "style": {"stroke": "rgba(177,177,183,255)", "strokeWidth": 1.3},
     }
 
-    # Check if the edge already exists in the list before adding it
-    # Check if the edge already exists in the list before adding it
-    if edge not in lista:
-        lista.append(edge)
+    # Add the edge unless it already exists in the list
+    lista.add(edge)
 
 
-def process_document(doc: dict, structure: dict, members: dict):
+class GraphBuilder:
     """
-    Process a document and update the structure and members.
+    Build the structure and members of PDFs from their MongoDB documents.
 
-    Args:
-        doc (dict): Document data.
-        structure (dict): Document structure.
-        members (dict): Document members.
+    Nodes and edges are indexed by id and paragraph blocks by (label, section),
+    so building a graph is linear in the number of documents and blocks.
 
-    Returns:
-        None
+    Parameters:
+    structure (dict, optional): Document structure to fill. Defaults to a new dict.
+    members (dict, optional): Document members to fill. Defaults to a new dict.
+
+    Attributes:
+    structure (dict): PDF title -> nodes and edges of the PDF hierarchy.
+    members (dict): PDF title -> page_block -> nodes and edges of the block.
+
+    Methods:
+    process_document(doc): Adds a MongoDB document to the graph of its PDF.
+    build(): Sorts the graphs and returns the structure and members.
     """
-    pdf_title = doc["pdf"]
-    index = "Index"
-    introduction = "Introduction"
-    start_page_value = doc.get("start_page", 0)
-    chapter = doc.get("chapter", None)
-    images = doc.get("images", None)
-    page = str(doc.get("page", None))
-    phrases = doc.get("phrases", None)
-    section = doc.get("section", None)
-
-    if pdf_title not in structure:
-        structure[pdf_title] = {"initialNodes": [], "initialEdges": []}
-
-    if pdf_title not in members:
-        members[pdf_title] = {}
-
-    initial_nodes = structure[pdf_title]["initialNodes"]
-    initial_edges = structure[pdf_title]["initialEdges"]
-
-    block_nodes_edges = members[pdf_title]
-
-    if "Images" not in structure[pdf_title]:
-        structure[pdf_title]["Images"] = {
-            "imgNodes": [],
-            "imgEdges": [],
-            "nodeTypes": [],
-        }
 
-    imgNodes = structure[pdf_title]["Images"]["imgNodes"]
-    imgEdges = structure[pdf_title]["Images"]["imgEdges"]
-    nodeTypes = structure[pdf_title]["Images"]["nodeTypes"]
-
-    # Save the initial value of start_page_value
-    initial_start_page_value.append(start_page_value)
-
-    create_node(pdf_title, pdf_title, 0, initial_nodes, 0, pdf_title, True)  # PDF
-    create_node(
-        index, index, 0.1, initial_nodes, initial_start_page_value[0], index, False
-    )  # Index
-    create_edge(pdf_title + index, pdf_title, index, "", initial_edges)  # PDF - Index
-    create_node(
-        introduction, introduction, 0.2, initial_nodes, 1, introduction, False
-    )  # Introduction
-    create_edge(
-        pdf_title + introduction, pdf_title, introduction, "", initial_edges
-    )  # PDF - Introduction
-
-    if chapter:
-        title = doc["title"]
-        node_id = str(chapter) + title
+    def __init__(self, structure: dict = None, members: dict = None):
+        self.structure = structure if structure is not None else {}
+        self.members = members if members is not None else {}
+        self.pdfs = {}
+
+    def _pdf_state(self, pdf_title: str):
+        """
+        Get the indexes of a PDF, creating its structure and members if needed.
+        """
+        if pdf_title in self.pdfs:
+            return self.pdfs[pdf_title]
+
+        if pdf_title not in self.structure:
+            self.structure[pdf_title] = {"initialNodes": [], "initialEdges": []}
+
+        if pdf_title not in self.members:
+            self.members[pdf_title] = {}
+
+        if "Images" not in self.structure[pdf_title]:
+            self.structure[pdf_title]["Images"] = {
+                "imgNodes": [],
+                "imgEdges": [],
+                "nodeTypes": [],
+            }
+
+        pdf_structure = self.structure[pdf_title]
+        images = pdf_structure["Images"]
+        state = {
+            "nodes": IndexedList(pdf_structure["initialNodes"]),
+            "edges": IndexedList(pdf_structure["initialEdges"]),
+            "imgNodes": IndexedList(images["imgNodes"]),
+            "imgEdges": IndexedList(images["imgEdges"]),
+            "nodeTypes": IndexedList(
+                images["nodeTypes"], key=lambda item: next(iter(item))
+            ),
+            # (label, section) -> [(position in initialNodes, node)] of the blocks
+            "blocks": {},
+            # Value of start_page of the first document of the PDF
+            "initial_start_page_value": None,
+        }
+        for position, node in enumerate(pdf_structure["initialNodes"]):
+            if "text" in node["data"]:
+                self._index_block(state, position, node)
+
+        self.pdfs[pdf_title] = state
+        return state
+
+    @staticmethod
+    def _index_block(state: dict, position: int, node: dict):
+        key = (node["data"]["label"], node["data"]["section"])
+        insort(state["blocks"].setdefault(key, []), (position, node))
+
+    def _add_block(self, state: dict, node_count: int):
+        """
+        Index the paragraph node appended to initialNodes, if one was appended.
+        """
+        nodes = state["nodes"].items
+        if len(nodes) > node_count:
+            self._index_block(state, node_count, nodes[node_count])
+
+    def process_document(self, doc: dict):
+        """
+        Process a document and update the structure and members.
+
+        Args:
+            doc (dict): Document data.
+
+        Returns:
+            None
+        """
+        pdf_title = doc["pdf"]
+        index = "Index"
+        introduction = "Introduction"
+        start_page_value = doc.get("start_page", 0)
+        chapter = doc.get("chapter", None)
+        images = doc.get("images", None)
+        page = str(doc.get("page", None))
+        phrases = doc.get("phrases", None)
+        section = doc.get("section", None)
+
+        state = self._pdf_state(pdf_title)
+
+        initial_nodes = state["nodes"]
+        initial_edges = state["edges"]
+
+        block_nodes_edges = self.members[pdf_title]
+
+        imgNodes = state["imgNodes"]
+        imgEdges = state["imgEdges"]
+        nodeTypes = state["nodeTypes"]
+
+        # Save the initial value of start_page_value
+        if state["initial_start_page_value"] is None:
+            state["initial_start_page_value"] = start_page_value
+
+        create_node(pdf_title, pdf_title, 0, initial_nodes, 0, pdf_title, True)  # PDF
         create_node(
-            node_id, title, chapter, initial_nodes, start_page_value, title, False
-        )  # Chapters index
+            index,
+            index,
+            0.1,
+            initial_nodes,
+            state["initial_start_page_value"],
+            index,
+            False,
+        )  # Index
         create_edge(
-            index + node_id, index, node_id, "", initial_edges
-        )  # Index - Chapter
+            pdf_title + index, pdf_title, index, "", initial_edges
+        )  # PDF - Index
         create_node(
-            title, title, chapter, initial_nodes, start_page_value, title, False
-        )  # Chapters PDF
+            introduction, introduction, 0.2, initial_nodes, 1, introduction, False
+        )  # Introduction
         create_edge(
-            pdf_title + title, pdf_title, title, "", initial_edges
-        )  # PDF - Chapter
-
-    if phrases:
-        for phrase in phrases:
-            block_number = phrase["block_number"]
-            page_block = page + "_" + str(block_number)
-            block_title = phrase["block_title"]
-            block_text = phrase["block_text"]
-            number_part = 1
-
-            # Check if the block with the same title already exists
-            existing_block = next(
-                (
-                    node
-                    for node in initial_nodes
-                    if node["data"]["label"] == block_title
-                    and "text" in node["data"]
-                    and section == node["data"]["section"]
-                ),
-                None,
-            )
-
-            if existing_block:
-                # If the block exists, append the new text to its existing text
-                block_id = page_block + "_" + str(number_part)
-                existing_block["data"]["label"] += f" (part {number_part})"
-                number_part += 1
-                create_paragraph_node(
-                    block_id,
-                    block_title + f" (part {number_part})",
-                    block_text,
-                    section,
-                    int(page),
-                    initial_nodes,
-                    block_number,
-                    False,
-                )  # Block
-                create_edge(
-                    section + block_id,
-                    section,
-                    block_id,
-                    "",
-                    initial_edges,
-                )  # Chapter - Block
-
-            else:
-                # If the block doesn't exist, create a new block
-                create_paragraph_node(
-                    page_block,
-                    block_title,
-                    block_text,
-                    section,
-                    int(page),
-                    initial_nodes,
-                    block_number,
+            pdf_title + introduction, pdf_title, introduction, "", initial_edges
+        )  # PDF - Introduction
+
+        if chapter:
+            title = doc["title"]
+            node_id = str(chapter) + title
+            create_node(
+                node_id, title, chapter, initial_nodes, start_page_value, title, False
+            )  # Chapters index
+            create_edge(
+                index + node_id, index, node_id, "", initial_edges
+            )  # Index - Chapter
+            create_node(
+                title, title, chapter, initial_nodes, start_page_value, title, False
+            )  # Chapters PDF
+            create_edge(
+                pdf_title + title, pdf_title, title, "", initial_edges
+            )  # PDF - Chapter
+
+        if phrases:
+            for phrase in phrases:
+                block_number = phrase["block_number"]
+                page_block = page + "_" + str(block_number)
+                block_title = phrase["block_title"]
+                block_text = phrase["block_text"]
+                number_part = 1
+
+                # Check if the block with the same title already exists
+                same_blocks = state["blocks"].get((block_title, section))
+                existing_block = same_blocks[0][1] if same_blocks else None
+
+                node_count = len(initial_nodes.items)
+
+                if existing_block:
+                    # If the block exists, append the new text to its existing text
+                    block_id = page_block + "_" + str(number_part)
+                    position, _ = same_blocks.pop(0)
+                    existing_block["data"]["label"] += f" (part {number_part})"
+                    self._index_block(state, position, existing_block)
+                    number_part += 1
+                    create_paragraph_node(
+                        block_id,
+                        block_title + f" (part {number_part})",
+                        block_text,
+                        section,
+                        int(page),
+                        initial_nodes,
+                        block_number,
+                        False,
+                    )  # Block
+                    create_edge(
+                        section + block_id,
+                        section,
+                        block_id,
+                        "",
+                        initial_edges,
+                    )  # Chapter - Block
+
+                else:
+                    # If the block doesn't exist, create a new block
+                    create_paragraph_node(
+                        page_block,
+                        block_title,
+                        block_text,
+                        section,
+                        int(page),
+                        initial_nodes,
+                        block_number,
+                        False,
+                    )  # Block
+                    create_edge(
+                        section + page_block, section, page_block, "", initial_edges
+                    )  # Chapter - Block
+
+                self._add_block(state, node_count)
+
+                initialEdges = phrase.get("initialEdges", None)
+                initialNodes = phrase.get("initialNodes", None)
+
+                if initialNodes:
+                    if page_block not in block_nodes_edges:
+                        block_nodes_edges[page_block] = {
+                            "initialNodes": [],
+                            "initialEdges": [],
+                        }
+                    block_nodes_edges[page_block]["initialNodes"] = initialNodes
+                    block_nodes_edges[page_block]["initialEdges"] = initialEdges
+
+        if images:
+            for img in images:
+                if isinstance(img, dict):
+                    # The node shows the thumbnail, a click opens the display
+                    # variant and the original is only downloaded on request
+                    img_id = original = img["original"]
+                    display = img.get("display", original)
+                    url = img.get("thumbnail", display)
+                else:
+                    img_id, url, original, display = img, img, None, None
+                create_handle_node(
+                    page + img_id,
+                    page,
+                    url,
+                    imgNodes,
+                    nodeTypes,
                     False,
-                )  # Block
-                create_edge(
-                    section + page_block, section, page_block, "", initial_edges
-                )  # Chapter - Block
-
-            initialEdges = phrase.get("initialEdges", None)
-            initialNodes = phrase.get("initialNodes", None)
-
-            if initialNodes:
-                if page_block not in block_nodes_edges:
-                    block_nodes_edges[page_block] = {
-                        "initialNodes": [],
-                        "initialEdges": [],
-                    }
-                block_nodes_edges[page_block]["initialNodes"] = initialNodes
-                block_nodes_edges[page_block]["initialEdges"] = initialEdges
-
-    if images:
-        for img in images:
-            create_handle_node(page + img, page, img, imgNodes, nodeTypes, False)
-            create_edge(page + "_" + img, section, page + img, "", imgEdges)
+                    original,
+                    display,
+                )
+                create_edge(page + "_" + img_id, section, page + img_id, "", imgEdges)
+
+    def build(self):
+        """
+        Sort the nodes and edges of every PDF processed so far.
+
+        Returns:
+            tuple: The structure and the members.
+        """
+        for pdf_title in self.pdfs:
+            sort_and_merge_nodes_and_edges(self.structure[pdf_title])
+        # The sorted lists replace the indexed ones
+        self.pdfs = {}
+        return self.structure, self.members
 
 
 def sort_and_merge_nodes_and_edges(pdf_data: dict):
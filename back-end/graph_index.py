@@ -0,0 +1,233 @@
+from collections import deque
+
+# Limits of the k-hop expansion
+MAX_HOPS = 4
+DEFAULT_MAX_NODES = 500
+MAX_NODES = 5000
+
+DIRECTIONS = ("out", "in", "both")
+
+
+class GraphIndex:
+    """
+    In-memory index of the knowledge graph of a PDF: the concept graphs of all
+    its blocks (members) merged by node id, with forward and reverse adjacency.
+
+    Nodes are numbered and the adjacency lists hold (neighbor, edge) pairs of
+    integers, so traversals never touch the React-Flow dictionaries.
+    """
+
+    def __init__(self):
+        self.node_ids = []
+        self.node_index = {}
+        self.edge_source = []
+        self.edge_target = []
+        self.edge_label = []
+        self.edge_block = []
+        self.forward = []
+        self.reverse = []
+
+    @classmethod
+    def from_members(cls, pdf_members: dict):
+        """
+        Build the index from the members of a PDF.
+
+        Args:
+            pdf_members (dict): page_block -> {"initialNodes", "initialEdges"}.
+
+        Returns:
+            GraphIndex: The index.
+        """
+        index = cls()
+        for page_block, block_graph in pdf_members.items():
+            for node in block_graph.get("initialNodes", []):
+                index._node(node["id"])
+            for edge in block_graph.get("initialEdges", []):
+                index._edge(
+                    edge["source"], edge["target"], edge.get("label", ""), page_block
+                )
+        return index
+
+    def _node(self, node_id: str):
+        """
+        Return the number of a node, adding it if new.
+        """
+        number = self.node_index.get(node_id)
+        if number is None:
+            number = self.node_index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+            self.forward.append([])
+            self.reverse.append([])
+        return number
+
+    def _edge(self, source: str, target: str, label: str, page_block: str):
+        source, target = self._node(source), self._node(target)
+        edge = len(self.edge_source)
+        self.edge_source.append(source)
+        self.edge_target.append(target)
+        self.edge_label.append(label)
+        self.edge_block.append(page_block)
+        self.forward[source].append((target, edge))
+        self.reverse[target].append((source, edge))
+
+    def __contains__(self, node_id: str):
+        return node_id in self.node_index
+
+    def _adjacent(self, number: int, direction: str):
+        if direction == "out":
+            return self.forward[number]
+        if direction == "in":
+            return self.reverse[number]
+        return self.forward[number] + self.reverse[number]
+
+    def _edge_dict(self, edge: int):
+        return {
+            "source": self.node_ids[self.edge_source[edge]],
+            "target": self.node_ids[self.edge_target[edge]],
+            "label": self.edge_label[edge],
+            "block": self.edge_block[edge],
+        }
+
+    def neighbors(self, node_id: str, direction: str = "both", limit: int = None):
+        """
+        Return the edges connecting a node to its neighbors.
+
+        Args:
+            node_id (str): The node.
+            direction (str): "out" (successors), "in" (predecessors) or "both".
+            limit (int, optional): Maximum number of edges returned (not negative).
+
+        Returns:
+            list: The edges, as dictionaries with source, target, label and block.
+        """
+        if limit is not None and limit < 0:
+            raise ValueError("limit must not be negative")
+        adjacent = self._adjacent(self.node_index[node_id], direction)
+        return [self._edge_dict(edge) for _, edge in adjacent[:limit]]
+
+    def k_hop(
+        self,
+        node_id: str,
+        k: int,
+        direction: str = "both",
+        max_nodes: int = DEFAULT_MAX_NODES,
+    ):
+        """
+        Return the subgraph within k hops of a node (breadth-first).
+
+        Args:
+            node_id (str): The starting node.
+            k (int): Number of hops, clamped to [0, MAX_HOPS].
+            direction (str): "out", "in" or "both".
+            max_nodes (int): Maximum number of nodes, clamped to [1, MAX_NODES];
+                             the expansion stops there.
+
+        Returns:
+            dict: "nodes" (id and depth), "edges" and "truncated".
+        """
+        k = max(0, min(k, MAX_HOPS))
+        max_nodes = max(1, min(max_nodes, MAX_NODES))
+        start = self.node_index[node_id]
+        depth = {start: 0}
+        edges = set()
+        queue = deque([start])
+        truncated = False
+
+        while queue:
+            number = queue.popleft()
+            if depth[number] >= k:
+                continue
+            for neighbor, edge in self._adjacent(number, direction):
+                if neighbor not in depth:
+                    if len(depth) >= max_nodes:
+                        truncated = True
+                        continue
+                    depth[neighbor] = depth[number] + 1
+                    queue.append(neighbor)
+                edges.add(edge)
+
+        return {
+            "nodes": [
+                {"id": self.node_ids[number], "depth": hops}
+                for number, hops in depth.items()
+            ],
+            "edges": [self._edge_dict(edge) for edge in sorted(edges)],
+            "truncated": truncated,
+        }
+
+    def shortest_path(self, source_id: str, target_id: str, directed: bool = False):
+        """
+        Find a shortest (fewest edges) path between two nodes with a
+        bidirectional breadth-first search.
+
+        Args:
+            source_id (str): The first node.
+            target_id (str): The last node.
+            directed (bool): Follow the edges only in their direction.
+
+        Returns:
+            list: The edges of the path (empty if source and target coincide),
+                  or None if the nodes are not connected.
+        """
+        source = self.node_index[source_id]
+        target = self.node_index[target_id]
+        if source == target:
+            return []
+
+        forward_direction, backward_direction = (
+            ("out", "in") if directed else ("both", "both")
+        )
+        # Node -> (previous node, edge) on each side
+        forward_parent = {source: None}
+        backward_parent = {target: None}
+        forward_frontier = [source]
+        backward_frontier = [target]
+        meeting = None
+
+        while forward_frontier and backward_frontier and meeting is None:
+            # Expand the smaller frontier
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meeting = self._expand(
+                    forward_frontier, forward_direction, forward_parent, backward_parent
+                )
+            else:
+                backward_frontier, meeting = self._expand(
+                    backward_frontier,
+                    backward_direction,
+                    backward_parent,
+                    forward_parent,
+                )
+
+        if meeting is None:
+            return None
+
+        path = []
+        number = meeting
+        while forward_parent[number] is not None:
+            number, edge = forward_parent[number]
+            path.append(edge)
+        path.reverse()
+        number = meeting
+        while backward_parent[number] is not None:
+            number, edge = backward_parent[number]
+            path.append(edge)
+
+        return [self._edge_dict(edge) for edge in path]
+
+    def _expand(self, frontier: list, direction: str, parent: dict, other_parent: dict):
+        """
+        Expand one level of a side of the bidirectional search.
+
+        Returns:
+            tuple: The next frontier and the node where the two sides met (or None).
+        """
+        next_frontier = []
+        for number in frontier:
+            for neighbor, edge in self._adjacent(number, direction):
+                if neighbor in parent:
+                    continue
+                parent[neighbor] = (number, edge)
+                if neighbor in other_parent:
+                    return next_frontier, neighbor
+                next_frontier.append(neighbor)
+        return next_frontier, None
@@ -0,0 +1,236 @@
+from collections import defaultdict
+
+# Node size and spacing, the same used by the front end (Layout_element.js)
+NODE_WIDTH = 172
+NODE_HEIGHT = 36
+RANK_SEPARATION = 50
+NODE_SEPARATION = 50
+
+# Sweeps of the crossing reduction and of the coordinate alignment
+ORDERING_SWEEPS = 4
+ALIGNMENT_SWEEPS = 4
+
+
+def layered_layout(nodes: list, edges: list, direction: str = "LR"):
+    """
+    Compute a layered (Sugiyama style) layout of a graph: cycles are broken,
+    nodes are assigned to layers by longest path, long edges are split with
+    dummy nodes, crossings are reduced with barycenter sweeps and the nodes are
+    aligned with their neighbours.
+
+    Args:
+        nodes (list): The React-Flow nodes.
+        edges (list): The React-Flow edges.
+        direction (str): "LR" (layers from left to right) or "TB" (top to bottom).
+
+    Returns:
+        list: Copies of the nodes with "position" (top-left corner, as React Flow
+              expects), "sourcePosition" and "targetPosition".
+    """
+    node_ids = list(dict.fromkeys(node["id"] for node in nodes))
+    known = set(node_ids)
+    links = [
+        (edge["source"], edge["target"])
+        for edge in edges
+        if edge["source"] in known
+        and edge["target"] in known
+        and edge["source"] != edge["target"]
+    ]
+
+    links = _break_cycles(node_ids, links)
+    rank = _assign_layers(node_ids, links)
+    layers, successors, predecessors = _split_long_edges(node_ids, links, rank)
+    _reduce_crossings(layers, successors, predecessors)
+    cross = _assign_coordinates(layers, successors, predecessors, direction)
+
+    horizontal = direction == "LR"
+    rank_step = (NODE_WIDTH if horizontal else NODE_HEIGHT) + RANK_SEPARATION
+
+    positioned = []
+    for node in nodes:
+        along = rank[node["id"]] * rank_step
+        across = cross[node["id"]]
+        x, y = (along, across) if horizontal else (across, along)
+        positioned.append(
+            {
+                **node,
+                "position": {"x": x, "y": y},
+                "sourcePosition": "right" if horizontal else "bottom",
+                "targetPosition": "left" if horizontal else "top",
+            }
+        )
+    return positioned
+
+
+def _break_cycles(node_ids: list, links: list):
+    """
+    Reverse the back edges found by a depth-first search, making the graph acyclic.
+    """
+    successors = defaultdict(list)
+    for source, target in links:
+        successors[source].append(target)
+
+    state = {}
+    back_edges = set()
+    for root in node_ids:
+        if root in state:
+            continue
+        state[root] = "active"
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                state[node] = "done"
+                stack.pop()
+            elif child not in state:
+                state[child] = "active"
+                stack.append((child, iter(successors[child])))
+            elif state[child] == "active":
+                back_edges.add((node, child))
+
+    return [
+        (target, source) if (source, target) in back_edges else (source, target)
+        for source, target in links
+    ]
+
+
+def _assign_layers(node_ids: list, links: list):
+    """
+    Assign each node to the layer after the deepest of its predecessors.
+    """
+    successors = defaultdict(list)
+    indegree = dict.fromkeys(node_ids, 0)
+    for source, target in links:
+        successors[source].append(target)
+        indegree[target] += 1
+
+    rank = dict.fromkeys(node_ids, 0)
+    queue = [node for node in node_ids if indegree[node] == 0]
+    while queue:
+        node = queue.pop()
+        for child in successors[node]:
+            rank[child] = max(rank[child], rank[node] + 1)
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                queue.append(child)
+    return rank
+
+
+def _split_long_edges(node_ids: list, links: list, rank: dict):
+    """
+    Build the layers, replacing each edge spanning several layers with a chain of
+    dummy nodes (one per layer crossed).
+    """
+    layers = defaultdict(list)
+    for node in node_ids:
+        layers[rank[node]].append(node)
+
+    successors = defaultdict(list)
+    predecessors = defaultdict(list)
+    for number, (source, target) in enumerate(dict.fromkeys(links)):
+        previous = source
+        for layer in range(rank[source] + 1, rank[target]):
+            dummy = ("dummy", number, layer)
+            rank[dummy] = layer
+            layers[layer].append(dummy)
+            successors[previous].append(dummy)
+            predecessors[dummy].append(previous)
+            previous = dummy
+        successors[previous].append(target)
+        predecessors[target].append(previous)
+
+    return [layers[layer] for layer in range(len(layers))], successors, predecessors
+
+
+def _reduce_crossings(layers: list, successors: dict, predecessors: dict):
+    """
+    Reorder the layers in place with alternating downward and upward barycenter sweeps.
+    """
+    for sweep in range(ORDERING_SWEEPS):
+        downward = sweep % 2 == 0
+        indexes = range(1, len(layers)) if downward else range(len(layers) - 2, -1, -1)
+        for index in indexes:
+            neighbors = predecessors if downward else successors
+            fixed = layers[index - 1] if downward else layers[index + 1]
+            position = {node: order for order, node in enumerate(fixed)}
+
+            def barycenter(item):
+                order, node = item
+                linked = [
+                    position[other] for other in neighbors[node] if other in position
+                ]
+                # Nodes without neighbours keep their place
+                return sum(linked) / len(linked) if linked else order
+
+            layers[index] = [
+                node for _, node in sorted(enumerate(layers[index]), key=barycenter)
+            ]
+
+
+def _assign_coordinates(
+    layers: list, successors: dict, predecessors: dict, direction: str
+):
+    """
+    Place the nodes of each layer along the cross axis: in order, at least one
+    node apart, pulled towards the average position of their neighbours.
+    """
+    size = (NODE_HEIGHT if direction == "LR" else NODE_WIDTH) + NODE_SEPARATION
+    cross = {}
+    for layer in layers:
+        for order, node in enumerate(layer):
+            cross[node] = order * size
+
+    for sweep in range(ALIGNMENT_SWEEPS):
+        downward = sweep % 2 == 0
+        neighbors = predecessors if downward else successors
+        for layer in layers if downward else reversed(layers):
+            wanted = []
+            for node in layer:
+                linked = [cross[other] for other in neighbors[node]]
+                wanted.append(sum(linked) / len(linked) if linked else cross[node])
+
+            # Keep the order and the separation, as close as possible to the wish
+            placed = []
+            for target in wanted:
+                placed.append(max(target, placed[-1] + size) if placed else target)
+            # Shift the layer so that it is centered on the wishes
+            shift = (
+                sum(w - p for w, p in zip(wanted, placed)) / len(placed)
+                if placed
+                else 0
+            )
+            for node, position in zip(layer, placed):
+                cross[node] = position + shift
+
+    # Only the real nodes are returned, starting from 0
+    lowest = min(cross.values(), default=0)
+    return {
+        node: round(position - lowest, 1)
+        for node, position in cross.items()
+        if not isinstance(node, tuple)
+    }
+
+
+def layout_members(pdf_members: dict):
+    """
+    Return a copy of the block graphs (members) of a PDF with the positions of
+    their nodes (layers from left to right, as BlockGraph.js shows them).
+
+    Args:
+        pdf_members (dict): The members of the PDF.
+
+    Returns:
+        dict: The members with positioned nodes.
+    """
+    return {
+        page_block: {
+            **block_graph,
+            "initialNodes": layered_layout(
+                block_graph.get("initialNodes", []),
+                block_graph.get("initialEdges", []),
+                "LR",
+            ),
+        }
+        for page_block, block_graph in pdf_members.items()
+    }
@@ -0,0 +1,136 @@
+import os
+
+# Levels of detail of the structure of a PDF, from the smallest to the full graph
+LEVELS = ("chapters", "top", "full")
+
+# Blocks kept under each chapter in the "top" level
+LOD_TOP_BLOCKS = int(os.getenv("LOD_TOP_BLOCKS", "5"))
+
+# Ranking of the blocks in the "top" level: "degree" or "pagerank"
+LOD_RANKING = os.getenv("LOD_RANKING", "degree")
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_ITERATIONS = 30
+
+
+def degree_scores(pdf_members: dict):
+    """
+    Score each block by the number of relationships of its knowledge graph.
+
+    Args:
+        pdf_members (dict): The members (block graphs) of the PDF.
+
+    Returns:
+        dict: page_block -> score.
+    """
+    return {
+        page_block: len(block_graph.get("initialEdges", []))
+        for page_block, block_graph in pdf_members.items()
+    }
+
+
+def pagerank_scores(pdf_members: dict):
+    """
+    Score each block by its PageRank in the bipartite graph linking the blocks to
+    the concepts (node labels) of their knowledge graphs, so that blocks sharing
+    many concepts with other blocks rank higher.
+
+    Args:
+        pdf_members (dict): The members (block graphs) of the PDF.
+
+    Returns:
+        dict: page_block -> score.
+    """
+    neighbors = {}
+    for page_block, block_graph in pdf_members.items():
+        block = ("block", page_block)
+        concepts = {
+            ("concept", node["id"]) for node in block_graph.get("initialNodes", [])
+        }
+        neighbors[block] = list(concepts)
+        for concept in concepts:
+            neighbors.setdefault(concept, []).append(block)
+
+    if not neighbors:
+        return {}
+
+    size = len(neighbors)
+    rank = dict.fromkeys(neighbors, 1.0 / size)
+    for _ in range(PAGERANK_ITERATIONS):
+        # Rank of the vertices without links, spread over every vertex
+        dangling = sum(rank[vertex] for vertex, links in neighbors.items() if not links)
+        base = (1.0 - PAGERANK_DAMPING + PAGERANK_DAMPING * dangling) / size
+        new_rank = dict.fromkeys(neighbors, base)
+        for vertex, links in neighbors.items():
+            if links:
+                share = PAGERANK_DAMPING * rank[vertex] / len(links)
+                for neighbor in links:
+                    new_rank[neighbor] += share
+        rank = new_rank
+
+    return {vertex[1]: score for vertex, score in rank.items() if vertex[0] == "block"}
+
+
+def compute_levels(pdf_structure: dict, pdf_members: dict, ranking: str = LOD_RANKING):
+    """
+    Compute the reduced levels of detail of the structure of a PDF: "chapters"
+    (no blocks) and "top" (the LOD_TOP_BLOCKS best ranked blocks of each chapter).
+    The chapters keep the number of hidden blocks in data.hiddenBlocks.
+
+    Args:
+        pdf_structure (dict): The structure of the PDF.
+        pdf_members (dict): The members (block graphs) of the PDF.
+        ranking (str): "degree" or "pagerank".
+
+    Returns:
+        dict: Level -> structure of the PDF at that level.
+    """
+    # The blocks are the paragraph nodes, the only ones with a text
+    blocks = {
+        node["id"] for node in pdf_structure["initialNodes"] if "text" in node["data"]
+    }
+    scores = (pagerank_scores if ranking == "pagerank" else degree_scores)(pdf_members)
+
+    # Blocks of each chapter, in document order
+    chapter_blocks = {}
+    for edge in pdf_structure["initialEdges"]:
+        if edge["target"] in blocks:
+            chapter_blocks.setdefault(edge["source"], []).append(edge["target"])
+
+    top_blocks = set()
+    for chapter, chapter_block_ids in chapter_blocks.items():
+        ranked = sorted(chapter_block_ids, key=lambda block: -scores.get(block, 0))
+        top_blocks.update(ranked[:LOD_TOP_BLOCKS])
+
+    return {
+        "chapters": _reduce(pdf_structure, blocks, set(), chapter_blocks),
+        "top": _reduce(pdf_structure, blocks, top_blocks, chapter_blocks),
+    }
+
+
+def _reduce(pdf_structure: dict, blocks: set, kept_blocks: set, chapter_blocks: dict):
+    """
+    Return the structure without the blocks that are not kept (and without images).
+    """
+    nodes = []
+    for node in pdf_structure["initialNodes"]:
+        if node["id"] in blocks:
+            if node["id"] in kept_blocks:
+                nodes.append(node)
+            continue
+        hidden = sum(
+            block not in kept_blocks for block in chapter_blocks.get(node["id"], [])
+        )
+        if hidden:
+            node = {**node, "data": {**node["data"], "hiddenBlocks": hidden}}
+        nodes.append(node)
+
+    edges = [
+        edge
+        for edge in pdf_structure["initialEdges"]
+        if all(
+            endpoint not in blocks or endpoint in kept_blocks
+            for endpoint in (edge["source"], edge["target"])
+        )
+    ]
+    return {"initialNodes": nodes, "initialEdges": edges}
@@ -0,0 +1,131 @@
+import base64
+from collections import deque
+
+# Page sizes of the paginated node and edge lists
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor is malformed or was issued for another graph version."""
+
+
+def encode_cursor(version: str, offset: int):
+    """
+    Encode an opaque pagination cursor bound to a graph version.
+
+    Args:
+        version (str): The version of the graph.
+        offset (int): The position of the next element.
+
+    Returns:
+        str: The cursor.
+    """
+    return base64.urlsafe_b64encode(f"{version}|{offset}".encode("utf-8")).decode()
+
+
+def decode_cursor(cursor: str, version: str):
+    """
+    Decode a pagination cursor, checking it belongs to the current graph version.
+
+    Args:
+        cursor (str): The cursor returned by a previous page.
+        version (str): The current version of the graph.
+
+    Returns:
+        int: The position of the next element.
+    """
+    try:
+        cursor_version, offset = (
+            base64.urlsafe_b64decode(cursor.encode()).decode("utf-8").rsplit("|", 1)
+        )
+        offset = int(offset)
+    except ValueError:
+        raise InvalidCursor("Malformed cursor")
+
+    if offset < 0:
+        raise InvalidCursor("Malformed cursor")
+    if cursor_version != str(version):
+        raise InvalidCursor("The graph changed since the cursor was issued")
+    return offset
+
+
+def paginate(items: list, version: str, cursor: str = None, limit: int = None):
+    """
+    Return a page of a list of nodes or edges.
+
+    Args:
+        items (list): The full list.
+        version (str): The version of the graph the list belongs to.
+        cursor (str, optional): The cursor of the page, None for the first one.
+        limit (int, optional): The page size, clamped to [1, MAX_PAGE_SIZE].
+
+    Returns:
+        dict: The "items" of the page, the "next_cursor" (None on the last page)
+              and the "total" number of elements.
+    """
+    limit = DEFAULT_PAGE_SIZE if limit is None else max(1, min(limit, MAX_PAGE_SIZE))
+    offset = decode_cursor(cursor, version) if cursor else 0
+    end = offset + limit
+
+    return {
+        "items": items[offset:end],
+        "next_cursor": encode_cursor(version, end) if end < len(items) else None,
+        "total": len(items),
+    }
+
+
+def chapter_subgraph(pdf_data: dict, chapter: str):
+    """
+    Extract the subtree of a chapter from the structure of a PDF: the chapter
+    node, every node reachable from it and the images of the chapter.
+
+    Args:
+        pdf_data (dict): The structure of the PDF.
+        chapter (str): The id of the chapter node (its title).
+
+    Returns:
+        dict: The subtree in the same format as the structure, or None if the
+              chapter does not exist.
+    """
+    # Materialized once (the stored graphs build each node on access)
+    nodes = list(pdf_data["initialNodes"])
+    if not any(node["id"] == chapter for node in nodes):
+        return None
+
+    children = {}
+    for edge in pdf_data["initialEdges"]:
+        children.setdefault(edge["source"], []).append(edge)
+
+    # Breadth-first visit from the chapter node
+    visited = {chapter}
+    queue = deque([chapter])
+    edges = []
+    while queue:
+        node_id = queue.popleft()
+        for edge in children.get(node_id, []):
+            edges.append(edge)
+            if edge["target"] not in visited:
+                visited.add(edge["target"])
+                queue.append(edge["target"])
+
+    subgraph = {
+        "initialNodes": [node for node in nodes if node["id"] in visited],
+        "initialEdges": edges,
+    }
+
+    images = pdf_data.get("Images")
+    if images:
+        img_edges = [edge for edge in images["imgEdges"] if edge["source"] in visited]
+        img_ids = {edge["target"] for edge in img_edges}
+        subgraph["Images"] = {
+            "imgNodes": [node for node in images["imgNodes"] if node["id"] in img_ids],
+            "imgEdges": img_edges,
+            "nodeTypes": [
+                node_type
+                for node_type in images["nodeTypes"]
+                if next(iter(node_type)) in img_ids
+            ],
+        }
+
+    return subgraph
@@ -0,0 +1,157 @@
+import os
+import tempfile
+from graph import GraphBuilder
+from graph_levels import compute_levels
+from graph_layout import layout_members
+from concept_merging import merge_concepts
+from mongo_db_operations import (
+    find_pdf_documents,
+    find_source_version,
+    find_snapshot,
+    save_snapshot,
+)
+from firebase_operations import upload_file, read_artifact
+from structure_format import write_structure, read_structure, structure_file_name
+from logger import logger
+
+# Version of the snapshot content: increase it whenever the graph building code
+# changes the output, so that older snapshots are rebuilt
+SNAPSHOT_SCHEMA = 6
+
+
+def build_pdf_graph(pdf_title: str):
+    """
+    Build the graph of a PDF from its documents in MongoDB, with the layout
+    positions of the nodes of its block graphs. The structure is not laid out:
+    the hierarchy view shows only its expanded part, laid out by the client.
+
+    Args:
+        pdf_title (str): Title of the PDF.
+
+    Returns:
+        tuple: The structure and the members of the PDF.
+    """
+    builder = GraphBuilder()
+
+    for doc in find_pdf_documents(pdf_title):
+        builder.process_document(doc)
+
+    structure, members = builder.build()
+    if pdf_title not in structure:
+        return None, None
+
+    return structure[pdf_title], layout_members(members[pdf_title])
+
+
+def save_pdf_graph_snapshot(
+    pdf_title: str, pdf_structure: dict, pdf_members: dict, source_version: str
+):
+    """
+    Store the graph of a PDF, with its levels of detail and its merged concept
+    graph, as a snapshot artifact and record it in MongoDB.
+
+    Args:
+        pdf_title (str): Title of the PDF.
+        pdf_structure (dict): The structure of the PDF.
+        pdf_members (dict): The members (block graphs) of the PDF.
+        source_version (str): Version of the documents the graph was built from.
+
+    Returns:
+        tuple: The levels of detail, the concept graph and the version of the snapshot.
+    """
+    levels = compute_levels(pdf_structure, pdf_members)
+    concepts = merge_concepts({pdf_title: pdf_members})
+    snapshot = {
+        "schema": SNAPSHOT_SCHEMA,
+        "source_version": source_version,
+        "structure": pdf_structure,
+        "members": pdf_members,
+        "levels": levels,
+        "concepts": concepts,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = structure_file_name(f"{pdf_title}_graph")
+        file_path = os.path.join(tmp_dir, file_name)
+        write_structure(snapshot, file_path)
+        url = upload_file(file_path, f"snapshots/{file_name}")
+
+    save_snapshot(
+        pdf_title,
+        {"schema": SNAPSHOT_SCHEMA, "source_version": source_version, "url": url},
+    )
+    return levels, concepts, snapshot_version(source_version)
+
+
+def snapshot_version(source_version: str):
+    """
+    Return the version of a graph built from documents with the given version.
+    """
+    return f"{SNAPSHOT_SCHEMA}-{source_version}"
+
+
+def load_pdf_graph(pdf_title: str):
+    """
+    Load the graph of a PDF from its snapshot, rebuilding (and saving) the snapshot
+    when it is missing or stale.
+
+    Args:
+        pdf_title (str): Title of the PDF.
+
+    Returns:
+        tuple: The structure, the members, the levels of detail, the concept graph
+               and the version of the graph of the PDF.
+    """
+    source_version = find_source_version(pdf_title)
+    snapshot_info = find_snapshot(pdf_title)
+
+    if (
+        snapshot_info is not None
+        and snapshot_info["schema"] == SNAPSHOT_SCHEMA
+        and snapshot_info["source_version"] == source_version
+    ):
+        try:
+            with read_artifact(snapshot_info["url"]) as artifact:
+                snapshot = read_structure(artifact)
+            logger.info(f"Graph of '{pdf_title}' loaded from its snapshot.")
+            return (
+                snapshot["structure"],
+                snapshot["members"],
+                snapshot["levels"],
+                snapshot["concepts"],
+                snapshot_version(source_version),
+            )
+        except Exception as e:
+            logger.error(f"Unable to read the snapshot of '{pdf_title}': {e}")
+
+    logger.info(f"Graph snapshot of '{pdf_title}' missing or stale, rebuilding it.")
+    pdf_structure, pdf_members = build_pdf_graph(pdf_title)
+    if pdf_structure is None:
+        return None, None, None, None, None
+
+    levels, concepts, version = save_pdf_graph_snapshot(
+        pdf_title, pdf_structure, pdf_members, source_version
+    )
+    return pdf_structure, pdf_members, levels, concepts, version
+
+
+def refresh_pdf_graph_snapshot(pdf_title: str):
+    """
+    Rebuild the graph of a PDF and save its snapshot, at the end of the ingestion.
+
+    Args:
+        pdf_title (str): Title of the PDF.
+
+    Returns:
+        tuple: The structure, the members, the levels of detail, the concept graph
+               and the version of the graph of the PDF.
+    """
+    source_version = find_source_version(pdf_title)
+    pdf_structure, pdf_members = build_pdf_graph(pdf_title)
+    if pdf_structure is None:
+        return None, None, None, None, None
+
+    levels, concepts, version = save_pdf_graph_snapshot(
+        pdf_title, pdf_structure, pdf_members, source_version
+    )
+    return pdf_structure, pdf_members, levels, concepts, version
@@ -0,0 +1,329 @@
+import json
+import os
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+
+# Representation of the graphs kept in memory by the server: "compact" or "dict"
+GRAPH_STORE = os.getenv("GRAPH_STORE", "compact")
+
+# Sub-dictionaries shared as constants between the records (the styles)
+SHARED_KEYS = ("style",)
+
+
+class GraphStore:
+    """
+    Compact representation of the graphs (structure and members) of a PDF.
+
+    Every leaf value (ids, labels, sections, pages...) is interned once in a
+    value pool; each node or edge is stored as a layout number (the shape of its
+    dictionary, with the styles as shared constants) and a run of value numbers
+    in flat arrays. The React-Flow dictionaries are only rebuilt when serialized.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.value_index = {}
+        self.constants = []
+        self.constant_index = {}
+        self.layouts = []
+        self.layout_index = {}
+        self.nodes = RecordTable()
+        self.edges = RecordTable()
+        # Graph number -> list of (key, kind, payload), in the key order of the graph
+        self.graphs = []
+
+    def intern(self, value):
+        """
+        Return the number of a leaf value in the value pool, adding it if new.
+        """
+        # The type is part of the key, so 1, 1.0 and True stay distinct
+        key = (type(value), value)
+        number = self.value_index.get(key)
+        if number is None:
+            number = self.value_index[key] = len(self.values)
+            self.values.append(value)
+        return number
+
+    def constant(self, value):
+        """
+        Return the number of a shared constant (a style, or an unhashable value).
+        """
+        key = json.dumps(value)
+        number = self.constant_index.get(key)
+        if number is None:
+            number = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return number
+
+    def layout(self, skeleton: tuple):
+        """
+        Return the number of a record layout, adding it if new.
+        """
+        number = self.layout_index.get(skeleton)
+        if number is None:
+            number = self.layout_index[skeleton] = len(self.layouts)
+            self.layouts.append(skeleton)
+        return number
+
+    def _skeleton(self, value, leaves: array):
+        """
+        Return the skeleton of a value, appending its leaf values to leaves.
+        """
+        if isinstance(value, dict):
+            fields = []
+            for key, item in value.items():
+                if key in SHARED_KEYS and isinstance(item, dict):
+                    fields.append((key, ("c", self.constant(item))))
+                else:
+                    fields.append((key, self._skeleton(item, leaves)))
+            return ("d", tuple(fields))
+        if isinstance(value, (list, tuple)):
+            return ("c", self.constant(value))
+        leaves.append(self.intern(value))
+        return None
+
+    def _add_record(self, table, record: dict):
+        leaves = array("I")
+        skeleton = self._skeleton(record, leaves)
+        table.add(self.layout(skeleton), leaves)
+
+    def add_graph(self, graph: dict):
+        """
+        Store a graph: its lists of nodes and edges ("...Nodes", "...Edges") are
+        compacted, nested graphs are stored recursively, other values kept as is.
+
+        Args:
+            graph (dict): A React-Flow graph, e.g. {"initialNodes", "initialEdges"}.
+
+        Returns:
+            int: The number of the graph.
+        """
+        fields = []
+        for key, value in graph.items():
+            if isinstance(value, list) and key.endswith("Edges"):
+                start = len(self.edges)
+                for edge in value:
+                    self._add_record(self.edges, edge)
+                fields.append((key, "edges", (start, len(self.edges))))
+            elif isinstance(value, list) and key.endswith("Nodes"):
+                start = len(self.nodes)
+                for node in value:
+                    self._add_record(self.nodes, node)
+                fields.append((key, "nodes", (start, len(self.nodes))))
+            elif isinstance(value, dict) and any(
+                key.endswith(("Nodes", "Edges")) for key in value
+            ):
+                fields.append((key, "graph", self.add_graph(value)))
+            else:
+                fields.append((key, "value", value))
+        self.graphs.append(fields)
+        return len(self.graphs) - 1
+
+    def _build(self, skeleton, leaves, position: int):
+        """
+        Rebuild a value from its skeleton. Returns the value and the next leaf position.
+        """
+        if skeleton is None:
+            return self.values[leaves[position]], position + 1
+        if skeleton[0] == "c":
+            return self.constants[skeleton[1]], position
+        value = {}
+        for key, field in skeleton[1]:
+            value[key], position = self._build(field, leaves, position)
+        return value, position
+
+    def node(self, number: int):
+        """
+        Materialize a node as a React-Flow dictionary.
+        """
+        layout, leaves = self.nodes.record(number)
+        return self._build(self.layouts[layout], leaves, 0)[0]
+
+    def edge(self, number: int):
+        """
+        Materialize an edge as a React-Flow dictionary.
+        """
+        layout, leaves = self.edges.record(number)
+        return self._build(self.layouts[layout], leaves, 0)[0]
+
+    def memory_usage(self):
+        """
+        Estimate the bytes held by the store.
+
+        Returns:
+            int: The estimated size in bytes.
+        """
+        # The pools and their indexes share objects, counted once; the types in
+        # the keys of the value index belong to the interpreter
+        seen = {id(value_type) for value_type, _ in self.value_index}
+        size = sum(
+            deep_sizeof(items, seen)
+            for items in (
+                self.values,
+                self.value_index,
+                self.constants,
+                self.constant_index,
+                self.layouts,
+                self.layout_index,
+                self.graphs,
+            )
+        )
+        size += self.nodes.memory_usage() + self.edges.memory_usage()
+        return size
+
+
+class RecordTable:
+    """
+    Array-backed table of records: a layout number per record and the value
+    numbers of all the records in one flat array, delimited by offsets.
+    """
+
+    def __init__(self):
+        self.layout = array("I")
+        self.offsets = array("I", [0])
+        self.leaves = array("I")
+
+    def __len__(self):
+        return len(self.layout)
+
+    def add(self, layout: int, leaves: array):
+        self.layout.append(layout)
+        self.leaves.extend(leaves)
+        self.offsets.append(len(self.leaves))
+
+    def record(self, number: int):
+        start, stop = self.offsets[number], self.offsets[number + 1]
+        return self.layout[number], self.leaves[start:stop]
+
+    def memory_usage(self):
+        return sum(
+            sys.getsizeof(items) for items in (self.layout, self.offsets, self.leaves)
+        )
+
+
+class RecordList(Sequence):
+    """
+    Read-only list of the nodes or edges of a stored graph, materialized on access.
+    """
+
+    def __init__(self, store: GraphStore, kind: str, start: int, stop: int):
+        self.store = store
+        self.get = store.node if kind == "nodes" else store.edge
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.get(self.start + i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.get(self.start + index)
+
+
+class StoredGraph(Mapping):
+    """
+    Read-only, dictionary-like view of a stored graph.
+    """
+
+    def __init__(self, store: GraphStore, number: int):
+        self.store = store
+        self.fields = {
+            key: (kind, payload) for key, kind, payload in store.graphs[number]
+        }
+
+    def __getitem__(self, key):
+        kind, payload = self.fields[key]
+        if kind in ("nodes", "edges"):
+            return RecordList(self.store, kind, *payload)
+        if kind == "graph":
+            return StoredGraph(self.store, payload)
+        return payload
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+
+class StoredMembers(Mapping):
+    """
+    Read-only, dictionary-like view of the block graphs (members) of a PDF.
+    """
+
+    def __init__(self, store: GraphStore, blocks: dict):
+        self.store = store
+        self.blocks = blocks
+
+    def __getitem__(self, page_block):
+        return StoredGraph(self.store, self.blocks[page_block])
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+def compact_pdf_graph(pdf_structure: dict, pdf_members: dict):
+    """
+    Store the structure and the members of a PDF in one GraphStore.
+
+    Args:
+        pdf_structure (dict): The structure of the PDF.
+        pdf_members (dict): The members (block graphs) of the PDF.
+
+    Returns:
+        tuple: The read-only views of the structure and of the members, and the store.
+    """
+    store = GraphStore()
+    structure_number = store.add_graph(pdf_structure)
+    blocks = {
+        page_block: store.add_graph(block_graph)
+        for page_block, block_graph in pdf_members.items()
+    }
+    return StoredGraph(store, structure_number), StoredMembers(store, blocks), store
+
+
+def to_json(value):
+    """
+    JSON serializer of the stored graphs (json.dumps default), materializing the
+    React-Flow dictionaries.
+    """
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, Sequence):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def deep_sizeof(value, seen: set = None):
+    """
+    Estimate the bytes held by a value and everything it references.
+
+    Args:
+        value: A JSON-like value (dicts, lists, tuples and scalars).
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(
+            deep_sizeof(key, seen) + deep_sizeof(item, seen)
+            for key, item in value.items()
+        )
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_sizeof(item, seen) for item in value)
+    return size
@@ -0,0 +1,232 @@
+import base64
+import math
+import os
+import cv2
+import numpy as np
+from logger import logger
+
+# Encodings supported for the images sent to GPT4-Vision, and their MIME types
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def check_image_format(image_format: str):
+    """
+    Normalize an encoding of the images sent to GPT4-Vision.
+
+    Args:
+        image_format (str): The encoding, e.g. "jpeg" or "WEBP".
+
+    Returns:
+        str: The lower-case encoding.
+
+    Raises:
+        ValueError: If the encoding is not supported.
+    """
+    image_format = image_format.lower()
+    if image_format not in MIME_TYPES:
+        raise ValueError(
+            f"Unsupported vision image format {image_format!r}: "
+            f"use one of {', '.join(MIME_TYPES)}"
+        )
+    return image_format
+
+
+# Encoding used for the images sent to GPT4-Vision ("jpeg" or "webp")
+VISION_IMAGE_FORMAT = check_image_format(os.getenv("VISION_IMAGE_FORMAT", "jpeg"))
+VISION_IMAGE_QUALITY = 80
+
+# Tile limits of the vision model in "high" detail mode: the image is fitted
+# within 2048x2048, then scaled so that its shortest side is at most 768px
+VISION_MAX_SIDE = 2048
+VISION_MAX_SHORT_SIDE = 768
+VISION_TILE_SIZE = 512
+VISION_BASE_TOKENS = 85
+VISION_TILE_TOKENS = 170
+
+# Margin (in pixels) kept around the text bounding box
+CROP_MARGIN = 20
+
+# Size-bounded variants served to the graph UI instead of the original images
+IMAGE_VARIANTS = {"thumbnail": 256, "display": 1280}
+VARIANT_FORMAT = "webp"
+VARIANT_QUALITY = 80
+
+
+def vision_scale(width: int, height: int):
+    """
+    Compute the factor the vision model would apply to an image of the given size.
+
+    Args:
+        width (int): Width of the image in pixels.
+        height (int): Height of the image in pixels.
+
+    Returns:
+        float: The scale factor (never greater than 1).
+    """
+    scale = min(1.0, VISION_MAX_SIDE / max(width, height))
+    return min(scale, VISION_MAX_SHORT_SIDE / min(width, height))
+
+
+def estimate_image_tokens(width: int, height: int):
+    """
+    Estimate the number of input tokens an image costs in a high-detail vision request.
+
+    Args:
+        width (int): Width of the image in pixels.
+        height (int): Height of the image in pixels.
+
+    Returns:
+        int: The estimated number of image tokens.
+    """
+    scale = vision_scale(width, height)
+    tiles = math.ceil(width * scale / VISION_TILE_SIZE) * math.ceil(
+        height * scale / VISION_TILE_SIZE
+    )
+    return VISION_BASE_TOKENS + VISION_TILE_TOKENS * tiles
+
+
+def crop_to_text(image: np.ndarray):
+    """
+    Crop a grayscale page image to the bounding box of its content, plus a small margin.
+
+    Args:
+        image (np.ndarray): The grayscale image.
+
+    Returns:
+        np.ndarray: The cropped image (the original one if the page is blank).
+    """
+    # Dark pixels on a light background become foreground
+    _, mask = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return image
+
+    x, y, w, h = cv2.boundingRect(points)
+    top = max(0, y - CROP_MARGIN)
+    left = max(0, x - CROP_MARGIN)
+    bottom = min(image.shape[0], y + h + CROP_MARGIN)
+    right = min(image.shape[1], x + w + CROP_MARGIN)
+    return image[top:bottom, left:right]
+
+
+def prepare_vision_image(image_path: str, image_format: str = None):
+    """
+    Prepare a page image for a GPT4-Vision request: crop to the text, convert to
+    grayscale, downscale to the model's tile limits and encode it compressed.
+
+    Args:
+        image_path (str): Path of the page image (PNG).
+        image_format (str, optional): "jpeg" or "webp". Defaults to VISION_IMAGE_FORMAT.
+
+    Returns:
+        tuple: The image block for the chat request and a dictionary with the
+               payload bytes and token estimates before and after.
+    """
+    image_format = check_image_format(image_format or VISION_IMAGE_FORMAT)
+
+    with open(image_path, "rb") as image_file:
+        original_bytes = image_file.read()
+
+    image = cv2.imdecode(
+        np.frombuffer(original_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE
+    )
+    original_height, original_width = image.shape[:2]
+
+    image = crop_to_text(image)
+
+    height, width = image.shape[:2]
+    scale = vision_scale(width, height)
+    if scale < 1.0:
+        image = cv2.resize(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    if image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, VISION_IMAGE_QUALITY]
+    else:
+        params = [cv2.IMWRITE_JPEG_QUALITY, VISION_IMAGE_QUALITY]
+    _, encoded = cv2.imencode(f".{image_format}", image, params)
+    base64_image = base64.b64encode(encoded.tobytes()).decode("utf-8")
+
+    stats = {
+        "bytes_before": len(base64.b64encode(original_bytes)),
+        "bytes_after": len(base64_image),
+        "tokens_before": estimate_image_tokens(original_width, original_height),
+        "tokens_after": estimate_image_tokens(image.shape[1], image.shape[0]),
+    }
+    logger.info(
+        f"Vision image {os.path.basename(image_path)}: "
+        f"{stats['bytes_before']} -> {stats['bytes_after']} bytes, "
+        f"~{stats['tokens_before']} -> ~{stats['tokens_after']} image tokens"
+    )
+
+    image_block = {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:{MIME_TYPES[image_format]};base64,{base64_image}",
+            "detail": "high",
+        },
+    }
+    return image_block, stats
+
+
+def create_image_variants(image_folder: str):
+    """
+    Create a compressed, size-bounded copy of every image of a folder for each of
+    IMAGE_VARIANTS, saved in a sub-folder named after the variant.
+
+    Args:
+        image_folder (str): The folder containing the original PNG images.
+
+    Returns:
+        dict: Image file name -> {variant: path of the variant relative to image_folder}.
+    """
+    image_variants = {}
+    image_files = sorted(
+        file for file in os.listdir(image_folder) if file.endswith(".png")
+    )
+
+    for variant in IMAGE_VARIANTS:
+        os.makedirs(os.path.join(image_folder, variant), exist_ok=True)
+
+    original_bytes = 0
+    variant_bytes = dict.fromkeys(IMAGE_VARIANTS, 0)
+
+    for image_file in image_files:
+        image_path = os.path.join(image_folder, image_file)
+        image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            logger.error(f"Unable to read image {image_path}")
+            continue
+        original_bytes += os.path.getsize(image_path)
+
+        height, width = image.shape[:2]
+        stem = os.path.splitext(image_file)[0]
+        image_variants[image_file] = {}
+
+        for variant, max_side in IMAGE_VARIANTS.items():
+            scale = min(1.0, max_side / max(width, height))
+            resized = image
+            if scale < 1.0:
+                resized = cv2.resize(
+                    image,
+                    (max(1, round(width * scale)), max(1, round(height * scale))),
+                    interpolation=cv2.INTER_AREA,
+                )
+
+            variant_file = os.path.join(variant, f"{stem}.{VARIANT_FORMAT}")
+            variant_path = os.path.join(image_folder, variant_file)
+            cv2.imwrite(
+                variant_path, resized, [cv2.IMWRITE_WEBP_QUALITY, VARIANT_QUALITY]
+            )
+            variant_bytes[variant] += os.path.getsize(variant_path)
+            image_variants[image_file][variant] = variant_file
+
+    logger.info(
+        f"Image variants created for {len(image_variants)} images: "
+        f"originals {original_bytes} bytes, "
+        + ", ".join(f"{name} {size} bytes" for name, size in variant_bytes.items())
+    )
+    return image_variants
@@ -0,0 +1,117 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+# Weights of the dense (embeddings) and lexical (BM25) rankings in the fusion
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+
+# Rank offset of the reciprocal rank fusion (60 in the original paper)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words, and identifiers made of words joined by dots, dashes, slashes or
+# underscores (section numbers, versions, "TCP/IP", "ISO-9001", ...)
+TOKEN_PATTERN = re.compile(r"\w+(?:[./\-_]\w+)*")
+
+
+def tokenize(text: str):
+    """
+    Split a text into lowercase terms. An identifier is kept whole and also split
+    into its parts, so "3.2.1" matches "3.2.1" exactly and "TCP/IP" matches "TCP".
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The terms.
+    """
+    terms = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        terms.append(token)
+        parts = re.split(r"[./\-_]", token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part)
+    return terms
+
+
+class BM25Index:
+    """
+    In-memory inverted index of texts, ranked with Okapi BM25.
+
+    Parameters:
+    texts (list): The texts; their positions are the document ids.
+
+    Attributes:
+    postings (dict): Term -> list of (document id, term frequency).
+    lengths (list): The number of terms of each document.
+    """
+
+    def __init__(self, texts: list):
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for doc_id, text in enumerate(texts):
+            terms = tokenize(text)
+            self.lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((doc_id, frequency))
+        self.postings = dict(self.postings)
+        self.average_length = (
+            sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        )
+
+    def idf(self, term: str):
+        """
+        Return the inverse document frequency of a term (never negative).
+        """
+        count = len(self.postings.get(term, ()))
+        size = len(self.lengths)
+        return math.log(1 + (size - count + 0.5) / (count + 0.5))
+
+    def search(self, query: str, k: int):
+        """
+        Return the k documents with the best BM25 score for a query.
+
+        Args:
+            query (str): The query.
+            k (int): The number of documents.
+
+        Returns:
+            list: (document id, score) pairs, best first.
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, frequency in postings:
+                norm = BM25_K1 * (
+                    1 - BM25_B + BM25_B * self.lengths[doc_id] / self.average_length
+                )
+                scores[doc_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+def reciprocal_rank_fusion(rankings: list, weights: list, k: int = RRF_K):
+    """
+    Fuse rankings of documents: each document scores the weighted sum of
+    1 / (k + rank) over the rankings it appears in.
+
+    Args:
+        rankings (list): Lists of document ids, best first.
+        weights (list): The weight of each ranking.
+        k (int): The rank offset, damping the weight of the first ranks.
+
+    Returns:
+        list: The document ids, best first.
+    """
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
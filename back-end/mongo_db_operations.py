@@ -1,4 +1,5 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
 from logger import logger
 from dotenv import load_dotenv
 import os
@@ -14,11 +15,42 @@ db = clientMongoDB["NewTest"]
 # Select collections
 collection_url = db["new_URL"]
 collection_pdf = db["new_PDF"]
+collection_snapshot = db["graph_snapshots"]
+
+# Number of documents sent in each insert_many
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", 500))
+
+# Projection of the documents: the fields read by GraphBuilder.process_document
+PAGE_PROJECTION = {
+    "_id": 0,
+    "pdf": 1,
+    "title": 1,
+    "chapter": 1,
+    "start_page": 1,
+    "section": 1,
+    "page": 1,
+    "phrases": 1,
+    "images": 1,
+}
+
+
+def ensure_indexes():
+    """
+    Create the indexes used by the queries, if they don't already exist. Called
+    once at the start of the application, not at import.
+
+    Returns:
+        None
+    """
+    # Serves the queries on a PDF and the most recent document of a PDF
+    collection_pdf.create_index([("pdf", ASCENDING), ("_id", DESCENDING)])
+    collection_url.create_index([("title", ASCENDING)])
+    collection_snapshot.create_index([("pdf", ASCENDING)], unique=True)
 
 
 def mongo_load_data(mongo_data: dict):
     """
-    Load data into MongoDB.
+    Load data into MongoDB, in unordered batches of MONGO_BATCH_SIZE documents.
 
     Args:
         mongo_data (dict): Data to be loaded, organized as a dictionary of lists of documents.
@@ -26,22 +58,67 @@ def mongo_load_data(mongo_data: dict):
         Returns:
             None
     """
-    documents_to_insert = []
+    inserted = 0
+    batch = []
+
+    def flush(batch: list):
+        # Unordered: the server can apply the batch in parallel and a failing
+        # document does not stop the others
+        try:
+            return len(collection_pdf.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            logger.error(f"Errors during the insertion: {e.details['writeErrors']}")
+            return e.details["nInserted"]
 
     for pdf_file, pdf_documents in mongo_data.items():
         for document in pdf_documents:
-            documents_to_insert.append(document)
-
-    # Insert the list of documents into the collection
-    if documents_to_insert:
-        collection_pdf.insert_many(documents_to_insert).inserted_ids
-        logger.info(
-            f"Successfully inserted {len(documents_to_insert)} documents into MongoDB"
-        )
+            batch.append(document)
+            if len(batch) >= MONGO_BATCH_SIZE:
+                inserted += flush(batch)
+                batch = []
+
+    if batch:
+        inserted += flush(batch)
+
+    if inserted:
+        logger.info(f"Successfully inserted {inserted} documents into MongoDB")
     else:
         logger.error("No documents to insert")
 
 
+def find_pdf_titles():
+    """
+    Get the titles of the PDFs stored in MongoDB.
+
+    Returns:
+        list: The PDF titles.
+    """
+    return collection_pdf.distinct("pdf")
+
+
+def find_pdf_documents(pdf_title: str):
+    """
+    Get every document (chapters and pages) of a PDF.
+
+    Args:
+        pdf_title (str): Title of the PDF.
+
+    Returns:
+        Cursor: The documents, without their MongoDB id.
+    """
+    return collection_pdf.find({"pdf": pdf_title}, PAGE_PROJECTION)
+
+
+def find_urls():
+    """
+    Get the title and URL of every PDF.
+
+    Returns:
+        Cursor: The URL documents.
+    """
+    return collection_url.find({}, {"_id": 0, "title": 1, "url": 1})
+
+
 def load_url(pdf_title: str, pdf_url: str):
     """
     Load a URL into MongoDB.
@@ -60,3 +137,51 @@ def load_url(pdf_title: str, pdf_url: str):
         logger.info(f"URL '{pdf_url}' with title '{pdf_title}' successfully inserted.")
     else:
         logger.error("Error during the insertion of the URl into MongoDB.")
+
+
+def find_source_version(pdf_title: str):
+    """
+    Get a fingerprint of the documents of a PDF, which changes whenever documents
+    of that PDF are inserted or removed.
+
+    Args:
+        pdf_title (str): Title of the PDF.
+
+    Returns:
+        str: The number of documents and the id of the most recent one.
+    """
+    count = collection_pdf.count_documents({"pdf": pdf_title})
+    latest = collection_pdf.find_one(
+        {"pdf": pdf_title}, {"_id": 1}, sort=[("_id", DESCENDING)]
+    )
+    return f"{count}:{latest['_id'] if latest else ''}"
+
+
+def find_snapshot(pdf_title: str):
+    """
+    Get the information about the graph snapshot of a PDF.
+
+    Args:
+        pdf_title (str): Title of the PDF.
+
+    Returns:
+        dict: The snapshot information (schema, source version, url), or None.
+    """
+    return collection_snapshot.find_one({"pdf": pdf_title}, {"_id": 0})
+
+
+def save_snapshot(pdf_title: str, snapshot_info: dict):
+    """
+    Save the information about the graph snapshot of a PDF, replacing the previous one.
+
+    Args:
+        pdf_title (str): Title of the PDF.
+        snapshot_info (dict): The snapshot information (schema, source version, url).
+
+    Returns:
+        None
+    """
+    collection_snapshot.replace_one(
+        {"pdf": pdf_title}, {"pdf": pdf_title, **snapshot_info}, upsert=True
+    )
+    logger.info(f"Graph snapshot of '{pdf_title}' saved.")
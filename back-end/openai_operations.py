@@ -3,6 +3,7 @@ import re
 import json
 import ast
 from logger import logger
+from tracing import increment_span_attribute
 import tiktoken
 from dotenv import load_dotenv
 import os
@@ -101,6 +102,7 @@ def call_chat_gpt(text: str):
     # Calcola e registra i token in input
     input_tokens = num_tokens_from_string(prompt, "cl100k_base")
     total_input_tokens_gpt_4 += input_tokens
+    increment_span_attribute("input_tokens", input_tokens)
     logger.info(f"Token in input: {input_tokens}")
     logger.info(f"GPT4 Total input tokens: {total_input_tokens_gpt_4}")
 
@@ -112,6 +114,7 @@ def call_chat_gpt(text: str):
     # Calcola e registra i token in output
     output_tokens = num_tokens_from_string(res, "cl100k_base")
     total_output_tokens_gpt_4 += output_tokens
+    increment_span_attribute("output_tokens", output_tokens)
     logger.info(f"Token in output: {output_tokens}")
     logger.info(f"GPT4 Total output tokens: {total_output_tokens_gpt_4}")
 
@@ -444,6 +447,7 @@ def nodes_and_edges(new_structure: dict):
                     # Calcola e registra i token in input
                     input_tokens = num_tokens_from_string(frasi, "cl100k_base")
                     total_input_tokens_gpt_3_5 += input_tokens
+                    increment_span_attribute("input_tokens", input_tokens)
                     logger.info(f"Token in input: {input_tokens}")
                     logger.info(
                         f"GPT3.5-Turbo Total input tokens: {total_input_tokens_gpt_3_5}"
@@ -455,6 +459,7 @@ def nodes_and_edges(new_structure: dict):
                     # Calcola e registra i token in output
                     output_tokens = num_tokens_from_string(result, "cl100k_base")
                     total_output_tokens_gpt_3_5 += output_tokens
+                    increment_span_attribute("output_tokens", output_tokens)
                     logger.info(f"Token in output: {output_tokens}")
                     logger.info(
                         f"GPT3.5-Turbo Total output tokens: {total_output_tokens_gpt_3_5}"
@@ -499,6 +504,7 @@ def generate_index(messages: list):
     message_str = json.dumps(messages[0])
     input_tokens = num_tokens_from_string(message_str, "cl100k_base")
     logger.info(f"GPT4V Token in input: {input_tokens}")
+    increment_span_attribute("input_tokens", input_tokens)
 
     # Execute the GPT-4-vision-preview completion request
     response = client.chat.completions.create(
@@ -513,6 +519,7 @@ def generate_index(messages: list):
     # Calcola e registra i token in output
     output_tokens = num_tokens_from_string(response_content, "cl100k_base")
     logger.info(f"Token in output: {output_tokens}")
+    increment_span_attribute("output_tokens", output_tokens)
 
     # Remove "```", "json", and "\n" from the JSON string
     cleaned_json_string = (
@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Maximum number of query embeddings kept in memory
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+# Maximum number of reranked retrieval results kept in memory
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))
+
+
+def normalize_query(query: str):
+    """
+    Normalize a query, so that the same question asked with another case,
+    spacing or final punctuation hits the same entry.
+
+    Args:
+        query (str): The query.
+
+    Returns:
+        str: The normalized query.
+    """
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ")
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with hit-rate statistics.
+
+    Parameters:
+    size (int): The maximum number of entries.
+
+    Attributes:
+    hits (int): The lookups answered from the cache.
+    misses (int): The lookups computed.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, compute):
+        """
+        Return the cached value of a key, computing it on a miss.
+
+        Args:
+            key (tuple): The key; its first element is the version it depends on
+                         (the corpus or the embedding model).
+            compute (callable): Returns the value.
+
+        Returns:
+            The value.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, version: str):
+        """
+        Drop the entries of a version (e.g. of a corpus that changed or was evicted).
+
+        Args:
+            version (str): The version.
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == version]:
+                del self.entries[key]
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Return the size, the hits, the misses and the hit rate of the cache.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxSize": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Query embeddings, keyed by (embedding provider, normalized query)
+query_embeddings = QueryCache(QUERY_EMBEDDING_CACHE_SIZE)
+
+# Reranked document ids, keyed by (corpus version, normalized query, settings)
+retrieval_results = QueryCache(RETRIEVAL_CACHE_SIZE)
+
+
+def query_cache_stats():
+    """
+    Return the statistics of the query caches.
+    """
+    return {
+        "queryEmbeddings": query_embeddings.stats(),
+        "retrievalResults": retrieval_results.stats(),
+    }
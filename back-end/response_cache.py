@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from graph_store import to_json
+from logger import logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Maximum number of serialized responses kept in memory
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class CachedResponse:
+    """
+    A JSON response serialized once and stored pre-compressed.
+
+    Parameters:
+    version (str): The version of the graph the response was built from.
+    body (bytes): The serialized JSON.
+    """
+
+    def __init__(self, version: str, body: bytes):
+        self.version = version
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.encodings = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+
+    def select(self, accept_encoding):
+        """
+        Choose the smallest encoding accepted by the client.
+
+        Args:
+            accept_encoding: The Accept-Encoding header of the request.
+
+        Returns:
+            tuple: The encoding, its body and its (strong) ETag.
+        """
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in self.encodings and candidate in accept_encoding:
+                if len(self.encodings[candidate]) < len(self.encodings[encoding]):
+                    encoding = candidate
+        # Each encoding is a different representation, so it gets its own ETag
+        etag = self.etag if encoding == "identity" else f"{self.etag}-{encoding}"
+        return encoding, self.encodings[encoding], etag
+
+    def etags(self):
+        """
+        Return the ETags of every stored encoding.
+        """
+        return [self.etag] + [
+            f"{self.etag}-{encoding}"
+            for encoding in self.encodings
+            if encoding != "identity"
+        ]
+
+
+class ResponseCache:
+    """
+    LRU cache of the serialized graph responses. An entry is rebuilt when the
+    version of the graph it was built from changes.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple, version: str, build):
+        """
+        Return the cached response of a key, serializing build() on a miss or
+        when the version changed.
+
+        Args:
+            key (tuple): The key of the response; its first element is the PDF
+                         title (None for the responses covering every PDF).
+            version (str): The current version of the graph.
+            build (callable): Returns the data of the response.
+
+        Returns:
+            CachedResponse: The cached response.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version == version:
+                self.entries.move_to_end(key)
+                return entry
+
+        # The compact graphs are materialized here, at serialization time
+        body = json.dumps(
+            build(), separators=(",", ":"), ensure_ascii=False, default=to_json
+        ).encode("utf-8")
+        entry = CachedResponse(version, body)
+        logger.info(
+            f"Response {key} serialized: "
+            + ", ".join(
+                f"{name} {len(data)} bytes" for name, data in entry.encodings.items()
+            )
+        )
+
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, pdf_title: str):
+        """
+        Drop the responses of a PDF and those covering every PDF.
+
+        Args:
+            pdf_title (str): The title of the PDF.
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0] in (pdf_title, None)]:
+                del self.entries[key]
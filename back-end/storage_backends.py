@@ -0,0 +1,136 @@
+import os
+import shutil
+from abc import ABC, abstractmethod
+import tempfile
+from urllib.parse import quote, unquote, urlparse
+from requests.adapters import HTTPAdapter
+import pyrebase
+import requests
+
+
+class StorageBackend(ABC):
+    """
+    Interface of the stores holding the artifacts of the PDFs (page images,
+    structure JSON, UMAP plots).
+
+    Methods:
+    put(file_path, destination_path): Stores a local file and returns its public URL.
+    url(destination_path): Returns the public URL of a stored artifact.
+    local_path(url): Returns a local path holding the artifact of a URL, or None.
+    """
+
+    @abstractmethod
+    def put(self, file_path: str, destination_path: str) -> str:
+        pass
+
+    @abstractmethod
+    def url(self, destination_path: str) -> str:
+        pass
+
+    def local_path(self, url: str):
+        return None
+
+
+def _copy_file(file_path: str, target_path: str):
+    """
+    Copy a file atomically, so readers never see a partially written artifact.
+    """
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path))
+    os.close(fd)
+    shutil.copyfile(file_path, tmp_path)
+    os.replace(tmp_path, target_path)
+
+
+class FirebaseStorage(StorageBackend):
+    """
+    Artifacts stored on Firebase Storage. A copy of every artifact uploaded by this
+    process is kept in a local cache folder, so it can be read back without a download.
+
+    Parameters:
+    config (dict): The Firebase configuration.
+    cache_dir (str): The folder of the local copies.
+    pool_size (int): Size of the HTTP connection pool shared by the uploads.
+    """
+
+    def __init__(self, config: dict, cache_dir: str, pool_size: int):
+        self.firebase = pyrebase.initialize_app(config)
+        self.cache_dir = cache_dir
+
+        # Size the HTTP session shared by every Storage instance to the worker pool
+        self.firebase.requests.mount(
+            "https://",
+            HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size),
+        )
+
+    def put(self, file_path: str, destination_path: str) -> str:
+        # Each upload gets its own Storage object (child() is stateful),
+        # all of them share the session of the Firebase app
+        self.firebase.storage().child(destination_path).put(file_path)
+        _copy_file(file_path, os.path.join(self.cache_dir, destination_path))
+        return self.url(destination_path)
+
+    def url(self, destination_path: str) -> str:
+        return self.firebase.storage().child(destination_path).get_url(None)
+
+    def local_path(self, url: str):
+        # Firebase URLs have the form .../o/<quoted destination path>?alt=media
+        path = urlparse(url).path
+        if "/o/" not in path:
+            return None
+        destination_path = unquote(path.split("/o/", 1)[1])
+        local_path = os.path.join(self.cache_dir, destination_path)
+        return local_path if os.path.exists(local_path) else None
+
+
+class LocalStorage(StorageBackend):
+    """
+    Artifacts stored on the local disk and published by the Flask application.
+
+    Parameters:
+    root (str): The folder holding the artifacts.
+    base_url (str): The public URL under which the root folder is served.
+    """
+
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+
+    def put(self, file_path: str, destination_path: str) -> str:
+        _copy_file(file_path, os.path.join(self.root, destination_path))
+        return self.url(destination_path)
+
+    def url(self, destination_path: str) -> str:
+        return f"{self.base_url}/{quote(destination_path)}"
+
+    def local_path(self, url: str):
+        if not url.startswith(self.base_url + "/"):
+            return None
+        destination_path = unquote(url[len(self.base_url) + 1 :])
+        local_path = os.path.abspath(os.path.join(self.root, destination_path))
+        # Never resolve a URL to a file outside of the storage root
+        if not local_path.startswith(self.root + os.sep):
+            return None
+        return local_path if os.path.exists(local_path) else None
+
+
+def open_artifact(backend: StorageBackend, url: str):
+    """
+    Open an artifact for reading, from its local path when the backend has one,
+    otherwise by streaming it over HTTP.
+
+    Args:
+        backend (StorageBackend): The storage backend in use.
+        url (str): The public URL of the artifact.
+
+    Returns:
+        file: A binary file-like object, to be closed by the caller.
+    """
+    local_path = backend.local_path(url) if url else None
+    if local_path is not None:
+        return open(local_path, "rb")
+
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return response.raw
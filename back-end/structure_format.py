@@ -0,0 +1,146 @@
+import gzip
+import io
+import json
+import os
+from logger import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Format of the document structure artifact: "compact" (compressed, versioned) or "json"
+STRUCTURE_FORMAT = os.getenv("STRUCTURE_FORMAT", "compact")
+
+# Header of the compact format: magic bytes, format version and codec
+MAGIC = b"QGSF"
+FORMAT_VERSION = 1
+CODEC_ZSTD = 1
+CODEC_GZIP = 2
+HEADER_SIZE = len(MAGIC) + 2
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+
+def structure_file_name(title: str):
+    """
+    Return the file name of the structure artifact of a PDF for the configured format.
+
+    Args:
+        title (str): The title of the PDF.
+
+    Returns:
+        str: The file name.
+    """
+    return f"{title}.qgs" if STRUCTURE_FORMAT == "compact" else f"{title}.json"
+
+
+def write_structure(data: dict, file_path: str):
+    """
+    Write the document structure in the configured format. The compact format is
+    minified JSON compressed with zstd (gzip when zstandard is not installed),
+    preceded by a header with the format version and the codec.
+
+    Args:
+        data (dict): The document structure.
+        file_path (str): The destination file.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    if STRUCTURE_FORMAT != "compact":
+        payload = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    else:
+        raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode(
+            "utf-8"
+        )
+        if zstandard is not None:
+            codec = CODEC_ZSTD
+            body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        else:
+            codec = CODEC_GZIP
+            body = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+        payload = MAGIC + bytes([FORMAT_VERSION, codec]) + body
+        logger.info(
+            f"Structure compressed from {len(raw)} to {len(payload)} bytes "
+            f"({'zstd' if codec == CODEC_ZSTD else 'gzip'})"
+        )
+
+    with open(file_path, "wb") as structure_file:
+        structure_file.write(payload)
+
+    return len(payload)
+
+
+def read_structure(stream):
+    """
+    Read a document structure from a binary stream, decompressing and parsing it
+    on the fly: with ijson installed the JSON text is never held in memory as a
+    whole (json.load, used otherwise, reads it entirely before parsing). Both the
+    compact format and plain JSON are accepted.
+
+    Args:
+        stream: A binary file-like object.
+
+    Returns:
+        dict: The document structure.
+    """
+    header = stream.read(HEADER_SIZE)
+
+    if not header.startswith(MAGIC):
+        # Plain JSON: put the bytes already read back in front of the stream
+        return _parse(_Prefixed(header, stream))
+
+    version, codec = header[len(MAGIC)], header[len(MAGIC) + 1]
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported structure format version: {version}")
+
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("The structure is zstd-compressed: install zstandard")
+        decompressed = zstandard.ZstdDecompressor().stream_reader(stream)
+    elif codec == CODEC_GZIP:
+        decompressed = gzip.GzipFile(fileobj=stream)
+    else:
+        raise ValueError(f"Unknown structure codec: {codec}")
+
+    with decompressed:
+        return _parse(decompressed)
+
+
+def _parse(stream):
+    """
+    Parse the JSON document of a binary stream, incrementally when ijson is installed.
+    """
+    if ijson is not None:
+        return next(ijson.items(stream, "", use_float=True))
+    return json.load(io.TextIOWrapper(stream, encoding="utf-8"))
+
+
+class _Prefixed(io.RawIOBase):
+    """
+    A readable binary stream returning some already read bytes before the rest of a stream.
+    """
+
+    def __init__(self, prefix: bytes, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.stream.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
@@ -0,0 +1,248 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logger import logger
+
+# Export configuration: "json" writes a flat list of spans, "otlp" writes the
+# OpenTelemetry JSON file format (resourceSpans -> scopeSpans -> spans)
+TRACE_EXPORT_FORMAT = os.getenv("TRACE_EXPORT_FORMAT", "json")
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+SERVICE_NAME = "questgraph-back-end"
+
+# Span currently active in this thread / context
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Finished spans grouped by trace id, waiting to be exported
+_finished_spans = {}
+_lock = threading.Lock()
+
+
+class Span:
+    """
+    A timed unit of work with attributes, linked to its parent through the trace id.
+
+    Attributes:
+    name (str): The name of the traced stage.
+    trace_id (str): Identifier shared by every span of the same trace (32 hex chars).
+    span_id (str): Identifier of this span (16 hex chars).
+    parent_id (str): Identifier of the parent span, None for the root span.
+    attributes (dict): Attributes describing the work (page count, tokens, bytes...).
+    """
+
+    def __init__(self, name: str, trace_id: str, parent_id: str, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.status = "OK"
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter_ns()
+        self.end_ns = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def increment_attribute(self, key: str, value=1):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def end(self):
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._start_perf)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Open a span as a child of the active one (or as the root of a new trace).
+
+    Args:
+        name (str): The name of the traced stage.
+        **attributes: Initial attributes of the span.
+
+    Yields:
+        Span: The opened span.
+    """
+    parent = _current_span.get()
+    trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    current = Span(name, trace_id, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.status = "ERROR"
+        current.error = repr(e)
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+        with _lock:
+            _finished_spans.setdefault(trace_id, []).append(current)
+        logger.debug(f"Span '{name}' took {current.duration_ms:.1f} ms")
+
+
+def traced(name: str, export: bool = False):
+    """
+    Decorator wrapping a function in a span. With export=True the whole trace is
+    written to disk when the function returns, which is meant for root spans.
+
+    Args:
+        name (str): The name of the span.
+        export (bool): Whether to export the trace once the span is closed.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            current = None
+            try:
+                with span(name) as current:
+                    return func(*args, **kwargs)
+            finally:
+                # The span is closed here, so the root is part of the export
+                if export and current is not None and current.parent_id is None:
+                    export_trace(current.trace_id)
+
+        return wrapper
+
+    return decorator
+
+
+def set_span_attributes(**attributes):
+    """Set attributes on the active span, doing nothing outside of a trace."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def increment_span_attribute(key: str, value=1):
+    """Increment a numeric attribute on the active span, doing nothing outside of a trace."""
+    current = _current_span.get()
+    if current is not None:
+        current.increment_attribute(key, value)
+
+
+def run_in_context(func):
+    """
+    Bind a callable to the current context, so spans opened inside worker threads
+    become children of the span active when the work was submitted.
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(spans: list) -> dict:
+    otlp_spans = []
+    for s in spans:
+        otlp_span = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in s.attributes.items()
+            ],
+            "status": (
+                {"code": 2, "message": s.error} if s.status == "ERROR" else {"code": 1}
+            ),
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        otlp_spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+def export_trace(trace_id: str, path: str = None, fmt: str = None):
+    """
+    Write every finished span of a trace to a file and forget them.
+
+    Args:
+        trace_id (str): The trace to export.
+        path (str, optional): Destination file. Defaults to TRACE_DIR/<trace_id>.json.
+        fmt (str, optional): "json" or "otlp". Defaults to TRACE_EXPORT_FORMAT.
+
+    Returns:
+        str: The path of the written file, or None if the trace has no spans.
+    """
+    fmt = fmt or TRACE_EXPORT_FORMAT
+
+    with _lock:
+        spans = _finished_spans.pop(trace_id, [])
+
+    if not spans:
+        return None
+
+    spans.sort(key=lambda s: s.start_ns)
+
+    if path is None:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        suffix = ".otlp.json" if fmt == "otlp" else ".json"
+        path = os.path.join(TRACE_DIR, trace_id + suffix)
+
+    if fmt == "otlp":
+        payload = _to_otlp(spans)
+    else:
+        payload = [s.to_dict() for s in spans]
+
+    with open(path, "w", encoding="utf-8") as trace_file:
+        json.dump(payload, trace_file, ensure_ascii=False)
+
+    # Summary of the top-level stages, to spot slow documents in the log
+    root_ids = {s.span_id for s in spans if s.parent_id is None}
+    for s in spans:
+        if s.parent_id in root_ids:
+            logger.info(f"[trace {trace_id[:8]}] {s.name}: {s.duration_ms:.1f} ms")
+
+    logger.info(f"Trace {trace_id} exported to {path}")
+    return path
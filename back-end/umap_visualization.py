@@ -1,4 +1,3 @@
-from Documents import Documents
 import umap
 import matplotlib.pyplot as plt
 import matplotlib
@@ -76,13 +75,10 @@ def create_umap_visualization(
     return link
 
 
-def create_initial_umap_visualization(json_url: str, title_of_pdf: str):
-    # Carica i documenti
-    docs = Documents(json_url)
-    # Crea la mappa UMAP
+def create_initial_umap_visualization(docs_embs: list, title_of_pdf: str):
+    # Crea la mappa UMAP degli embedding dei documenti (già calcolati dal corpus)
     reducer = umap.UMAP()
-    # Ottieni gli embedding dei documenti
-    embedding = reducer.fit_transform(docs.docs_embs)
+    embedding = reducer.fit_transform(np.asarray(docs_embs))
 
     title_of_pdf = title_of_pdf.replace(" ", "_")
     title_of_pdf = re.sub(r"[^\w\s-]|[\?@#]", "", title_of_pdf)
@@ -1,13 +1,15 @@
 import requests
 import fitz
+import hashlib
 import os
 import spacy
 import cv2
 import pytesseract
-import json
 from firebase_operations import upload_json_to_firebase
+from structure_format import structure_file_name, write_structure
 from openai_operations import call_chat_gpt
 from logger import logger
+from tracing import span
 
 # Carica i modelli di SpaCy in inglese
 nlp = spacy.load("en_core_web_trf")
@@ -27,18 +29,43 @@ def download_pdf_from_url(url: str, save_path: str):
         pdf_file.write(response.content)
 
 
-def process_page(doc: fitz.Document, page_num: int, pdf_name: str):
+def new_image_registry():
+    """
+    Create the registry shared by the process_page calls of a document, used to
+    extract every distinct embedded image only once.
+
+    Returns:
+    - dict: A registry with the following keys:
+      - "xrefs": xref -> file name of the extracted image.
+      - "hashes": pixel hash -> file name of the extracted image.
+      - "pages": page number -> list of the file names used by that page.
+    """
+    return {"xrefs": {}, "hashes": {}, "pages": {}}
+
+
+def process_page(
+    doc: fitz.Document, page_num: int, pdf_name: str, image_registry: dict = None
+):
     """
     Process a page of a PDF document, saving the page as an image and extracting images.
 
+    Images are extracted once per xref, and once per pixel content: a logo reused
+    on several pages is decoded and saved a single time, and every page using it
+    points to the same file in image_registry["pages"].
+
     Parameters:
     - doc (fitz.Document): The PyMuPDF document object.
     - page_num (int): The page number to process.
     - pdf_name (str): The name of the PDF file.
+    - image_registry (dict, optional): The registry created by new_image_registry,
+      shared by all the pages of the document.
 
     Returns:
     - image_list (list): A list of images extracted from the page.
     """
+    if image_registry is None:
+        image_registry = new_image_registry()
+
     # Load the specified page from the document
     page = doc.load_page(page_num)
 
@@ -58,27 +85,89 @@ def process_page(doc: fitz.Document, page_num: int, pdf_name: str):
 
     # Extract images from the page
     image_list = page.get_images()
+    page_images = image_registry["pages"].setdefault(page_num + 1, [])
 
     # Iterate over the images found on the page
     for image_index, img in enumerate(image_list, start=1):
         xref = img[0]
-        pix = fitz.Pixmap(doc, xref)
 
-        # Convert CMYK image to RGB if necessary
-        if pix.n - pix.alpha > 3:
-            pix = fitz.Pixmap(fitz.csRGB, pix)
+        # Image already extracted from this or a previous page
+        image_file = image_registry["xrefs"].get(xref)
+
+        if image_file is None:
+            pix = fitz.Pixmap(doc, xref)
+
+            # Convert CMYK image to RGB if necessary
+            if pix.n - pix.alpha > 3:
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+
+            # Same pixels stored under another xref
+            pixel_hash = hashlib.sha256(
+                f"{pix.width}x{pix.height}x{pix.n}".encode() + pix.samples
+            ).hexdigest()
+            image_file = image_registry["hashes"].get(pixel_hash)
 
-        # Save the image as a PNG in the new folder
-        image_filename = os.path.join(
-            image_folder, f"page_{page_num + 1}_image_{image_index}.png"
-        )
-        pix.save(image_filename)
-        pix = None
+            if image_file is None:
+                # Save the image as a PNG in the new folder
+                image_file = f"page_{page_num + 1}_image_{image_index}.png"
+                pix.save(os.path.join(image_folder, image_file))
+                image_registry["hashes"][pixel_hash] = image_file
+
+            image_registry["xrefs"][xref] = image_file
+            pix = None
+
+        if image_file not in page_images:
+            page_images.append(image_file)
 
     # Return the list of extracted images
     return image_list
 
 
+def index_from_outline(doc: fitz.Document):
+    """
+    Build the index of a PDF from its embedded bookmark outline.
+
+    Parameters:
+    - doc (fitz.Document): The PyMuPDF document object.
+
+    Returns:
+    - dict: The index in the format {"index": {"chapter N": {"title": ..., "page": ...}}},
+      or None if the PDF has no usable outline.
+    """
+    toc = doc.get_toc(simple=True)
+    if not toc:
+        return None
+
+    # Keep only the top level entries, the chapters
+    top_level = min(level for level, _, _ in toc)
+    chapters = []
+    for level, title, page in toc:
+        title = title.strip()
+        if level != top_level or not title or not 1 <= page <= len(doc):
+            continue
+        # These keys are already used by the document structure
+        if title in ("index", "Introduction"):
+            continue
+        if any(title == chapter["title"] for chapter in chapters):
+            continue
+        chapters.append({"title": title, "page": page})
+
+    # An outline with a single entry or going backwards is not a table of contents
+    if len(chapters) < 2:
+        logger.info("PDF outline not usable: too few chapters")
+        return None
+    if any(a["page"] > b["page"] for a, b in zip(chapters, chapters[1:])):
+        logger.info("PDF outline not usable: chapters are not in page order")
+        return None
+
+    result_json = {"index": {}}
+    for index, chapter in enumerate(chapters):
+        result_json["index"][f"chapter {index + 1}"] = chapter
+
+    logger.info(f"Index built from the PDF outline with {len(chapters)} chapters")
+    return result_json
+
+
 def divide_into_paragraphs(text: str):
     """
     Divide the given text into paragraphs and extracts titles from each paragraph.
@@ -256,56 +345,57 @@ def get_title(json_structure: dict):
                 previous_block_number = None
                 previous_block_title = None
                 for page_number, page_content in chapter_content.items():
-                    previous_block_text = None
-                    new_block = {}
-                    for block_number, text in page_content.items():
-                        if "images" in block_number:
-                            new_block["images"] = text
-                        if "images" not in block_number:
-                            block_text = " ".join(text)
-                            if block_text.strip():
-                                # Call Chat GPT API
-                                api_response = call_chat_gpt(text)
-                                if api_response.get(
-                                    "containTitle", False
-                                ) or api_response.get("containsTitle", False):
-                                    new_block[block_number] = {
-                                        "title": api_response["title"],
-                                        "text": block_text,
-                                    }
-
-                                    # Update the text of the previous block
-                                    previous_block_text = block_text
-                                    previous_block_number = block_number
-                                    previous_block_title = api_response["title"]
-                                else:
-                                    # If the current block has 'containTitle' False, concatenate the text to the previous block
-                                    if previous_block_text is not None:
-                                        previous_block_text += " " + block_text
-                                        new_block[previous_block_number] = {
-                                            "title": previous_block_title,
-                                            "text": previous_block_text,
-                                        }
-                                    else:
-                                        # If there is no previous block, add the text as a standalone block
+                    with span("titling.page", chapter=chapter_title, page=page_number):
+                        previous_block_text = None
+                        new_block = {}
+                        for block_number, text in page_content.items():
+                            if "images" in block_number:
+                                new_block["images"] = text
+                            if "images" not in block_number:
+                                block_text = " ".join(text)
+                                if block_text.strip():
+                                    # Call Chat GPT API
+                                    api_response = call_chat_gpt(text)
+                                    if api_response.get(
+                                        "containTitle", False
+                                    ) or api_response.get("containsTitle", False):
                                         new_block[block_number] = {
-                                            "title": previous_block_title,
+                                            "title": api_response["title"],
                                             "text": block_text,
                                         }
+
                                         # Update the text of the previous block
                                         previous_block_text = block_text
                                         previous_block_number = block_number
-
-                    data[pdf_title][chapter_title][page_number] = new_block
-
-    # Save the JSON string to a file
-    with open(f"{title}.json", "w", encoding="utf-8") as json_file:
-        json_file.write(json.dumps(data, indent=2, ensure_ascii=False))
+                                        previous_block_title = api_response["title"]
+                                    else:
+                                        # If the current block has 'containTitle' False, concatenate the text to the previous block
+                                        if previous_block_text is not None:
+                                            previous_block_text += " " + block_text
+                                            new_block[previous_block_number] = {
+                                                "title": previous_block_title,
+                                                "text": previous_block_text,
+                                            }
+                                        else:
+                                            # If there is no previous block, add the text as a standalone block
+                                            new_block[block_number] = {
+                                                "title": previous_block_title,
+                                                "text": block_text,
+                                            }
+                                            # Update the text of the previous block
+                                            previous_block_text = block_text
+                                            previous_block_number = block_number
+
+                        data[pdf_title][chapter_title][page_number] = new_block
+
+    # Save the structure to a file, compact and compressed unless configured otherwise
+    structure_file = structure_file_name(title)
+    write_structure(data, structure_file)
 
     logger.info("File JSON salvato con successo.")
 
     # Upload the file to Firebase
-    url = upload_json_to_firebase(f"{title}.json")
+    url = upload_json_to_firebase(structure_file)
 
     return data, url
 
@@ -115,7 +115,7 @@ function App() {
         await fetch('http://localhost:5002/url', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ url: data.url }),
+            body: JSON.stringify({ url: data.url, pdf: data.pdfTitleKey }),
         });
         setSelectedPDF(data);
     }
@@ -169,7 +169,7 @@ function App() {
         return fetch('http://localhost:5002/send-message', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ message: userInput }),
+            body: JSON.stringify({ message: userInput, pdf: selectedPDF?.pdfTitleKey }),
         }).then(async (response) => {
             toast.dismiss(toastLoading);
             const data = await response.json();
@@ -92,6 +92,9 @@ export default function Block({ nodeValue, nodeInfo, nodeColor, onCloseBlock })
               {isLink ? (
                 <div className='immagine'>
                   <img className='img' src={node} alt="Page img" />
+                  {nodeInfo[index].data.original && nodeInfo[index].data.original !== node && (
+                    <button className='risposteMenu-item' onClick={() => window.open(nodeInfo[index].data.original, '_blank')}>Original</button>
+                  )}
                   <button className='risposteMenu-item' onClick={() => closeBlock(index, node)}>Close</button>
                 </div>
               ) : (
@@ -53,6 +53,13 @@ const BlockGraph = ({ block }) => {
       // Filter nodes to include only those present in the edges
       const filteredNodes = nodes.filter(node => nodeIdsFromEdges.has(node.id));
 
+      // The backend sends the nodes already positioned: lay them out only otherwise
+      if (filteredNodes.every(node => node.position)) {
+        setNodes([...filteredNodes]);
+        setEdges([...edges]);
+        return;
+      }
+
       const { nodes: layoutedNodes, edges: layoutedEdges } = getLayoutedElements(filteredNodes, edges, 'LR');
 
       setNodes([...layoutedNodes]);
@@ -172,7 +172,7 @@ function ModalContent({ closeInfo, pdfName }) {
                             In the case of text, there is also a Knowledge Graph that displays a graph based on the text block.
                         </p>
                         <ul>
-                            <li>Images: Display the image with the "Close" button to close the block.</li>
+                            <li>Images: Display the image with the "Original" button to open the full-size image and the "Close" button to close the block.</li>
                             <li>Text: Show the text and provide three buttons.
                                 <ul>
                                     <li>"Original": Display the original text.</li>
@@ -335,7 +335,7 @@ const PDFStructure = forwardRef(({ postDataPdf, onNodeClick, setOptions, updateN
         graph(expandedNodes, updatedEdges)
 
         if (node.data.expandable === false) {
-            if (node.type !== undefined) onNodeClick(url, color, node);
+            if (node.type !== undefined) onNodeClick(node.data.display || node.data.original || url, color, node);
             else onNodeClick(node.data.text || data, color, node);
         }
     }